@@ -0,0 +1,126 @@
+import json
+import os
+from typing import Dict, Any
+from datetime import datetime, date
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from decimal import Decimal
+
+def get_db_connection():
+    dsn = os.environ.get('DATABASE_URL')
+    return psycopg2.connect(dsn)
+
+def json_serializer(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj)} is not JSON serializable')
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Admin dashboard platform metrics served from precomputed summaries
+    Args: event - dict with httpMethod, headers, queryStringParameters (days)
+          context - object with request_id attribute
+    Returns: HTTP response with platform metrics
+    '''
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Id',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers = event.get('headers', {})
+    admin_id = headers.get('X-Admin-Id') or headers.get('x-admin-id')
+
+    if not admin_id or not admin_id.isascii() or not admin_id.isdigit():
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Unauthorized'}),
+            'isBase64Encoded': False
+        }
+
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    query_params = event.get('queryStringParameters') or {}
+    days = query_params.get('days') or '30'
+    if not days.isascii() or not days.isdigit():
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid days'}),
+            'isBase64Encoded': False
+        }
+    days = min(max(int(days), 1), 366)
+
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    try:
+        cursor.execute('SELECT id FROM admin_users WHERE id = %s', (admin_id,))
+        if not cursor.fetchone():
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Forbidden'}),
+                'isBase64Encoded': False
+            }
+
+        cursor.execute('''
+            SELECT total_users, premium_users, active_users_30d, total_goals, completed_goals, refreshed_at
+            FROM platform_metrics
+        ''')
+        platform = cursor.fetchone()
+        metrics = dict(platform) if platform else {}
+
+        total_users = metrics.get('total_users') or 0
+        total_goals = metrics.get('total_goals') or 0
+        metrics['premium_conversion'] = (metrics['premium_users'] / total_users) if total_users else 0.0
+        metrics['goal_completion_rate'] = (metrics['completed_goals'] / total_goals) if total_goals else 0.0
+
+        cursor.execute('''
+            SELECT day, type, tx_count, total_amount
+            FROM transaction_daily_stats
+            WHERE day >= CURRENT_DATE - %s
+            ORDER BY day ASC, type ASC
+        ''', (days,))
+        volume = [dict(row) for row in cursor.fetchall()]
+
+        cursor.execute('''
+            SELECT type, NULLIF(tax_system, '') AS tax_system, organizations_count
+            FROM organization_metrics
+            ORDER BY type ASC, tax_system ASC
+        ''')
+        organizations = [dict(row) for row in cursor.fetchall()]
+
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'success': True,
+                'metrics': metrics,
+                'transactionVolume': volume,
+                'organizations': organizations
+            }, default=json_serializer),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        cursor.close()
+        conn.close()
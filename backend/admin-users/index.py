@@ -1,17 +1,145 @@
+import base64
+import gzip
 import json
 import hashlib
 import os
+import time
 import secrets
 import string
-from typing import Dict, Any
+from typing import Dict, Any, Optional, List, Tuple
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+READ_AFTER_WRITE_SECONDS = float(os.environ.get('READ_AFTER_WRITE_SECONDS', '5'))
+# user_id -> time of the last write from this instance, oldest first; pruned past the window
+last_write_at: 'OrderedDict[str, float]' = OrderedDict()
+
+FUNCTION_NAME = 'admin-users'
+# Keys of user creation store only a redacted response (no password), but stay short-lived anyway
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '1'))
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+USER_FIELDS = ('id', 'email', 'first_name', 'last_name', 'username', 'created_at', 'is_premium', 'premium_expires_at')
+
 def get_db_connection():
     dsn = os.environ.get('DATABASE_URL')
     return psycopg2.connect(dsn)
 
+def get_read_connection(user_id: str, headers: Dict[str, Any]):
+    read_dsn = os.environ.get('DATABASE_READ_URL')
+    if not read_dsn or wrote_recently(user_id, headers):
+        return get_db_connection()
+    return psycopg2.connect(read_dsn)
+
+def wrote_recently(user_id: str, headers: Dict[str, Any]) -> bool:
+    # Read-your-writes: stay on primary for a short window after this user's last mutation,
+    # known either from this warm instance or echoed back by the client
+    marker = last_write_at.get(user_id, 0.0)
+    client_marker = headers.get('X-Last-Write-At') or headers.get('x-last-write-at')
+    if client_marker and client_marker.isdigit():
+        marker = max(marker, int(client_marker) / 1000)
+    return time.time() - marker < READ_AFTER_WRITE_SECONDS
+
+def write_marker_headers(user_id: str) -> Dict[str, str]:
+    now = time.time()
+    last_write_at[user_id] = now
+    last_write_at.move_to_end(user_id)
+    while next(iter(last_write_at.values())) < now - READ_AFTER_WRITE_SECONDS:
+        last_write_at.popitem(last=False)
+    return {'X-Last-Write-At': str(int(now * 1000)), 'Access-Control-Expose-Headers': 'X-Last-Write-At'}
+
+def get_idempotency_key(headers: Dict[str, Any]) -> Optional[str]:
+    return headers.get('Idempotency-Key') or headers.get('idempotency-key') or None
+
+def claim_idempotency_key(cursor, scope: str, key: str, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # The claim is inserted in the request's own transaction: it commits together with the write
+    # (and its stored response) or rolls back with it, and a concurrent retry with the same key
+    # waits on the primary key until then. Returns the response to send instead, if any.
+    if len(key) > 255:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key is too long'}),
+            'isBase64Encoded': False
+        }
+    
+    request_hash = hashlib.sha256(json.dumps(
+        [event.get('httpMethod'), event.get('queryStringParameters') or {}, event.get('body') or ''], sort_keys=True
+    ).encode()).hexdigest()
+    cursor.execute('''
+        INSERT INTO idempotency_keys (function_name, scope, key, request_hash, expires_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 hour')
+        ON CONFLICT (function_name, scope, key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status_code = NULL, response_headers = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at <= CURRENT_TIMESTAMP
+        RETURNING key
+    ''', (FUNCTION_NAME, scope, key, request_hash, IDEMPOTENCY_TTL_HOURS))
+    if cursor.fetchone():
+        return None
+    
+    cursor.execute('''
+        SELECT request_hash, status_code, response_headers, response_body
+        FROM idempotency_keys
+        WHERE function_name = %s AND scope = %s AND key = %s
+    ''', (FUNCTION_NAME, scope, key))
+    stored = cursor.fetchone()
+    if stored['request_hash'] != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key was already used for a different request'}),
+            'isBase64Encoded': False
+        }
+    if stored['status_code'] is None:
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Request with this Idempotency-Key has no stored response'}),
+            'isBase64Encoded': False
+        }
+    
+    return {
+        'statusCode': stored['status_code'],
+        'headers': {
+            **stored['response_headers'],
+            'Idempotent-Replayed': 'true',
+            'Access-Control-Expose-Headers': 'X-Last-Write-At, Idempotent-Replayed'
+        },
+        'body': stored['response_body'],
+        'isBase64Encoded': False
+    }
+
+def commit_with_response(conn, cursor, scope: str, key: Optional[str], response: Dict[str, Any],
+                         replay: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # Stores the response under the claimed key before the commit, so a retry replays exactly it.
+    # Responses holding secrets pass a redacted replay to store instead.
+    if key:
+        stored = replay or response
+        cursor.execute('''
+            UPDATE idempotency_keys
+            SET status_code = %s, response_headers = %s, response_body = %s
+            WHERE function_name = %s AND scope = %s AND key = %s
+        ''', (stored['statusCode'], json.dumps(stored['headers']), stored['body'], FUNCTION_NAME, scope, key))
+    conn.commit()
+    return response
+
+def record_change(cursor, user_id: Any, entity: str, action: str, entity_ids: List[int]) -> None:
+    # Outbox row written in the mutation's own transaction; its commit wakes LISTEN change_events consumers
+    cursor.execute('''
+        INSERT INTO change_events (source, entity, action, user_id, entity_ids)
+        VALUES (%s, %s, %s, %s, %s)
+    ''', (FUNCTION_NAME, entity, action, user_id, entity_ids))
+
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
@@ -19,10 +147,56 @@ def generate_password(length: int = 12) -> str:
     alphabet = string.ascii_letters + string.digits
     return ''.join(secrets.choice(alphabet) for i in range(length))
 
+def parse_fields(query_params: Dict[str, Any], allowed: Tuple[str, ...]) -> Tuple[Optional[List[str]], Optional[str]]:
+    # ?fields=id,amount,date picks columns; the whitelist also makes them safe to put into SQL
+    requested = query_params.get('fields')
+    if not requested:
+        return None, None
+    
+    fields = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if not fields or unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}" if unknown else 'Empty fields'
+    return fields, None
+
+def shape_rows(rows: List[Dict[str, Any]], fields: Optional[List[str]], columnar: bool) -> Any:
+    # Columnar shape sends each key once: {"id": [...], "amount": [...]}
+    if columnar:
+        names = fields or list(dict.fromkeys(name for row in rows for name in row))
+        return {name: [row.get(name) for row in rows] for name in names}
+    if not fields:
+        return rows
+    return [{name: row.get(name) for name in fields} for row in rows]
+
+def encode_response(headers: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    # Large bodies are compressed when the client accepts it; the gateway decodes base64 bodies
+    body = response['body']
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    
+    accept = (headers.get('Accept-Encoding') or headers.get('accept-encoding') or '').lower()
+    accepted = {
+        part.split(';')[0].strip() for part in accept.split(',')
+        if not part.replace(' ', '').endswith(('q=0', 'q=0.0'))
+    }
+    if 'br' in accepted and brotli:
+        encoding, data = 'br', brotli.compress(body.encode('utf-8'), quality=BROTLI_QUALITY)
+    elif 'gzip' in accepted:
+        encoding, data = 'gzip', gzip.compress(body.encode('utf-8'), compresslevel=GZIP_LEVEL)
+    else:
+        return response
+    
+    return {
+        **response,
+        'headers': {**response['headers'], 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'},
+        'body': base64.b64encode(data).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Admin panel - create/list users with generated credentials
-    Args: event - dict with httpMethod, body, headers
+    Args: event - dict with httpMethod, body, headers, queryStringParameters (id, fields, format)
           context - object with request_id attribute
     Returns: HTTP response with user data
     '''
@@ -34,7 +208,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Id, X-Last-Write-At, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -52,7 +226,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = get_db_connection()
+    conn = get_read_connection(admin_id, headers) if method == 'GET' else get_db_connection()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
@@ -65,9 +239,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
+        idempotency_key = get_idempotency_key(headers) if method in ('POST', 'PUT', 'DELETE') else None
+        if idempotency_key:
+            replay = claim_idempotency_key(cursor, admin_id, idempotency_key, event)
+            if replay:
+                return replay
+        
         if method == 'GET':
-            cursor.execute('''
-                SELECT id, email, first_name, last_name, username, created_at, is_premium, premium_expires_at
+            query_params = event.get('queryStringParameters') or {}
+            fields, error = parse_fields(query_params, USER_FIELDS)
+            if error:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': error}),
+                    'isBase64Encoded': False
+                }
+            
+            cursor.execute(f'''
+                SELECT {', '.join(fields or USER_FIELDS)}
                 FROM users
                 WHERE email IS NOT NULL
                 ORDER BY created_at DESC
@@ -82,12 +272,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     user['premium_expires_at'] = user['premium_expires_at'].isoformat()
                 users.append(user)
             
-            return {
+            return encode_response(headers, {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'users': users}),
+                'body': json.dumps({'success': True, 'users': shape_rows(users, fields, query_params.get('format') == 'columnar')}),
                 'isBase64Encoded': False
-            }
+            })
         
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
@@ -113,17 +303,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             user = dict(user_row)
             if 'created_at' in user and user['created_at']:
                 user['created_at'] = user['created_at'].isoformat()
-            user['password'] = password
-            conn.commit()
+            
+            record_change(cursor, user['id'], 'user', 'created', [user['id']])
             
             print(f"User created successfully: {user}")
             
-            return {
+            # The generated password is returned once and never stored: a replay gets a 409
+            # naming the created user
+            response_headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(admin_id)}
+            return commit_with_response(conn, cursor, admin_id, idempotency_key, {
                 'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'user': user}),
+                'headers': response_headers,
+                'body': json.dumps({'success': True, 'user': {**user, 'password': password}}),
                 'isBase64Encoded': False
-            }
+            }, replay={
+                'statusCode': 409,
+                'headers': response_headers,
+                'body': json.dumps({'error': 'Request with this Idempotency-Key was already processed', 'user': user}),
+                'isBase64Encoded': False
+            })
         
         elif method == 'DELETE':
             query_params = event.get('queryStringParameters') or {}
@@ -147,14 +345,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             cursor.execute('UPDATE users SET email = NULL, password_hash = NULL WHERE id = %s', (user_id,))
-            conn.commit()
+            record_change(cursor, user_id, 'user', 'deleted', [int(user_id)])
             
-            return {
+            return commit_with_response(conn, cursor, admin_id, idempotency_key, {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(admin_id)},
                 'body': json.dumps({'success': True}),
                 'isBase64Encoded': False
-            }
+            })
         
         elif method == 'PUT':
             body = json.loads(event.get('body', '{}'))
@@ -189,17 +387,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                conn.commit()
                 user = dict(user_row)
                 if 'premium_expires_at' in user and user['premium_expires_at']:
                     user['premium_expires_at'] = user['premium_expires_at'].isoformat()
                 
-                return {
+                record_change(cursor, user['id'], 'user', 'premium_granted', [user['id']])
+                
+                return commit_with_response(conn, cursor, admin_id, idempotency_key, {
                     'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(admin_id)},
                     'body': json.dumps({'success': True, 'user': user}),
                     'isBase64Encoded': False
-                }
+                })
             
             elif action == 'revoke_premium':
                 cursor.execute('''
@@ -218,15 +417,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                conn.commit()
                 user = dict(user_row)
+                record_change(cursor, user['id'], 'user', 'premium_revoked', [user['id']])
                 
-                return {
+                return commit_with_response(conn, cursor, admin_id, idempotency_key, {
                     'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(admin_id)},
                     'body': json.dumps({'success': True, 'user': user}),
                     'isBase64Encoded': False
-                }
+                })
             
             return {
                 'statusCode': 400,
@@ -0,0 +1,481 @@
+import csv
+import io
+import json
+import mmap
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+from datetime import datetime, date, timedelta
+import numpy as np
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from decimal import Decimal
+
+READ_AFTER_WRITE_SECONDS = float(os.environ.get('READ_AFTER_WRITE_SECONDS', '5'))
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', '/tmp/analytics-snapshots')
+SNAPSHOT_MEMORY_SLOTS = int(os.environ.get('SNAPSHOT_MEMORY_SLOTS', '64'))
+SNAPSHOT_MAGIC = b'FPSNAP01'
+EPOCH = date(1970, 1, 1)
+
+FX_RATES_PATH = os.environ.get('FX_RATES_PATH', os.path.join(os.path.dirname(__file__), 'fx_rates.csv'))
+DEFAULT_CURRENCY = 'RUB'
+INSIGHTS_LIMIT_MAX = 200
+
+# Numeric query parameters: (default, min, max); values outside the range are clamped
+QUERY_NUMBERS = {
+    'months': (6, 1, 36),
+    'horizon': (3, 1, 36),
+    'limit': (50, 1, INSIGHTS_LIMIT_MAX),
+}
+
+# Columns of a snapshot, in file order; every column is a contiguous little-endian array
+COLUMNS = [('days', '<i4'), ('kopecks', '<i8'), ('is_income', '<i1'), ('category_ids', '<i4'), ('currency_ids', '<i2')]
+SNAPSHOT_FORMAT = 2
+
+def get_db_connection():
+    dsn = os.environ.get('DATABASE_URL')
+    return psycopg2.connect(dsn)
+
+def get_read_connection(headers: Dict[str, Any]):
+    read_dsn = os.environ.get('DATABASE_READ_URL')
+    client_marker = headers.get('X-Last-Write-At') or headers.get('x-last-write-at')
+    wrote_recently = bool(client_marker and client_marker.isdigit()
+                          and time.time() - int(client_marker) / 1000 < READ_AFTER_WRITE_SECONDS)
+    if not read_dsn or wrote_recently:
+        return get_db_connection()
+    return psycopg2.connect(read_dsn)
+
+def json_serializer(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    raise TypeError(f'Object of type {type(obj)} is not JSON serializable')
+
+
+class FxTable:
+    '''RUB-per-unit rates by currency, held as sorted int32 day / float64 rate arrays.
+    A date uses the latest rate on or before it (the earliest known rate before that).'''
+
+    def __init__(self, path: str):
+        rows: Dict[str, List[tuple]] = {}
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                rows.setdefault(row['currency'], []).append((to_day(row['date']), float(row['rub_per_unit'])))
+
+        self.codes = [DEFAULT_CURRENCY] + sorted(code for code in rows if code != DEFAULT_CURRENCY)
+        self.days: List[np.ndarray] = [np.zeros(1, np.int32)]
+        self.rates: List[np.ndarray] = [np.ones(1)]
+        for code in self.codes[1:]:
+            points = sorted(rows[code])
+            self.days.append(np.array([day for day, _ in points], dtype=np.int32))
+            self.rates.append(np.array([rate for _, rate in points], dtype=np.float64))
+
+    def code_id(self, code: str) -> int:
+        return self.codes.index(code) if code in self.codes else -1
+
+    def rub_rates(self, currency_ids: np.ndarray, days: np.ndarray) -> np.ndarray:
+        # One searchsorted per currency present, vectorized over all of its rows
+        rates = np.full(len(days), np.nan)
+        for cid in np.unique(currency_ids):
+            if cid < 0:
+                continue
+            mask = currency_ids == cid
+            index = np.searchsorted(self.days[cid], days[mask], 'right') - 1
+            rates[mask] = self.rates[cid][np.clip(index, 0, None)]
+        return rates
+
+    def convert(self, amounts: np.ndarray, currency_ids: np.ndarray, days: np.ndarray, target: str) -> np.ndarray:
+        '''Converts amounts into target at each row's date; unknown currencies come back as NaN'''
+        target_id = self.code_id(target)
+        target_rates = self.rub_rates(np.full(len(days), target_id, dtype=np.int16), days)
+        return amounts * self.rub_rates(currency_ids, days) / target_rates
+
+
+class Snapshot:
+    '''Per-user transactions as columns sorted by day: int32 days since epoch, int64 kopecks (minor
+    units of the row's currency), int8 income flag, int32 category ids, int16 index into fx_table.codes'''
+
+    def __init__(self, version: int, columns: Dict[str, np.ndarray], buffer: Optional[mmap.mmap] = None):
+        self.version = version
+        self.days = columns['days']
+        self.kopecks = columns['kopecks']
+        self.is_income = columns['is_income']
+        self.category_ids = columns['category_ids']
+        self.currency_ids = columns['currency_ids']
+        self._buffer = buffer
+        self._converted: Dict[str, 'Snapshot'] = {}
+
+    def converted(self, target: str) -> 'Snapshot':
+        '''Same rows with kopecks converted into target; rows in unknown currencies are dropped.
+        Kept on the snapshot, so a cached version converts once per currency.'''
+        if target in self._converted:
+            return self._converted[target]
+        if not len(self.currency_ids) or np.all(self.currency_ids == fx_table.code_id(target)):
+            self._converted[target] = self
+            return self
+        amounts = fx_table.convert(self.kopecks.astype(np.float64), self.currency_ids, self.days, target)
+        known = ~np.isnan(amounts)
+        self._converted[target] = Snapshot(self.version, {
+            'days': self.days[known],
+            'kopecks': np.rint(amounts[known]).astype(np.int64),
+            'is_income': self.is_income[known],
+            'category_ids': self.category_ids[known],
+            'currency_ids': np.full(int(known.sum()), fx_table.code_id(target), dtype=np.int16),
+        })
+        return self._converted[target]
+
+    @property
+    def signed_kopecks(self) -> np.ndarray:
+        return np.where(self.is_income == 1, self.kopecks, -self.kopecks)
+
+    def window(self, date_from: Optional[str], date_to: Optional[str]) -> 'Snapshot':
+        start = np.searchsorted(self.days, to_day(date_from), 'left') if date_from else 0
+        end = np.searchsorted(self.days, to_day(date_to), 'right') if date_to else len(self.days)
+        return Snapshot(self.version, {
+            'days': self.days[start:end],
+            'kopecks': self.kopecks[start:end],
+            'is_income': self.is_income[start:end],
+            'category_ids': self.category_ids[start:end],
+            'currency_ids': self.currency_ids[start:end],
+        }, self._buffer)
+
+    def write(self, path: str):
+        # A unique temp file per call: threads of one process may write the same snapshot at once
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.',
+                                         suffix='.tmp', delete=False) as f:
+            try:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(np.array([self.version, len(self.days)], dtype='<i8').tobytes())
+                for name, dtype in COLUMNS:
+                    data = np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes()
+                    f.write(data)
+                    f.write(b'\0' * (-len(data) % 8))
+            except BaseException:
+                os.remove(f.name)
+                raise
+        os.replace(f.name, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'Snapshot':
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:8] != SNAPSHOT_MAGIC:
+            raise ValueError(f'Not a snapshot file: {path}')
+        version, count = np.frombuffer(buffer, dtype='<i8', count=2, offset=8)
+        offset = 24
+        columns = {}
+        for name, dtype in COLUMNS:
+            columns[name] = np.frombuffer(buffer, dtype=dtype, count=int(count), offset=offset)
+            offset += columns[name].nbytes + (-columns[name].nbytes % 8)
+        return cls(int(version), columns, buffer)
+
+
+def to_day(value: str) -> int:
+    return (date.fromisoformat(value) - EPOCH).days
+
+memory_cache: 'OrderedDict[str, Snapshot]' = OrderedDict()
+fx_table = FxTable(FX_RATES_PATH)
+
+def snapshot_path(user_id: str, version: int) -> str:
+    return os.path.join(SNAPSHOT_DIR, f'{int(user_id)}.v{version}.f{SNAPSHOT_FORMAT}.snap')
+
+def remove_stale_snapshots(user_id: str, version: int) -> None:
+    # Covers versions this instance never held in memory and files of older snapshot formats;
+    # newer versions may belong to a concurrent request and are left alone
+    prefix = f'{int(user_id)}.v'
+    for name in os.listdir(SNAPSHOT_DIR):
+        if not name.startswith(prefix) or not name.endswith('.snap'):
+            continue
+        file_version, _, file_format = name[len(prefix):-len('.snap')].partition('.f')
+        if not file_version.isdigit() or not file_format.isdigit():
+            continue
+        if int(file_version) < version or int(file_format) != SNAPSHOT_FORMAT:
+            try:
+                os.remove(os.path.join(SNAPSHOT_DIR, name))
+            except FileNotFoundError:
+                pass
+
+def build_snapshot(cursor, user_id: str, version: int) -> Snapshot:
+    # COPY streams the rows as text and numpy parses them in C, no per-row Python objects.
+    # Archived months enter as one row per rollup, dated the first of the month.
+    buffer = io.StringIO()
+    cursor.copy_expert(cursor.mogrify('''
+        COPY (
+            SELECT date - DATE '1970-01-01', ROUND(amount * 100)::bigint,
+                   CASE WHEN type = 'income' THEN 1 ELSE 0 END, COALESCE(category_id, 0),
+                   COALESCE(array_position(%(codes)s::text[], currency::text), 0) - 1
+            FROM transactions
+            WHERE user_id = %(user_id)s AND amount > 0 AND deleted_at IS NULL
+            UNION ALL
+            SELECT month - DATE '1970-01-01', ROUND(total_amount * 100)::bigint,
+                   CASE WHEN type = 'income' THEN 1 ELSE 0 END, category_id,
+                   COALESCE(array_position(%(codes)s::text[], currency::text), 0) - 1
+            FROM transaction_archive_rollups
+            WHERE user_id = %(user_id)s AND total_amount > 0
+            ORDER BY 1
+        ) TO STDOUT WITH (FORMAT csv)
+    ''', {'codes': fx_table.codes, 'user_id': user_id}).decode(), buffer)
+    buffer.seek(0)
+
+    raw = np.loadtxt(buffer, delimiter=',', dtype=np.int64, ndmin=2) if buffer.getvalue() else np.empty((0, len(COLUMNS)), dtype=np.int64)
+    columns = {name: raw[:, i].astype(dtype) for i, (name, dtype) in enumerate(COLUMNS)}
+    return Snapshot(version, columns)
+
+def get_snapshot(cursor, user_id: str) -> Snapshot:
+    # Version probe and build run in one repeatable-read transaction so they agree
+    cursor.execute('SELECT version FROM user_data_versions WHERE user_id = %s', (user_id,))
+    row = cursor.fetchone()
+    version = row['version'] if row else 0
+
+    cached = memory_cache.get(user_id)
+    if cached and cached.version == version:
+        memory_cache.move_to_end(user_id)
+        return cached
+
+    path = snapshot_path(user_id, version)
+    if os.path.exists(path):
+        snapshot = Snapshot.load(path)
+    else:
+        snapshot = build_snapshot(cursor, user_id, version)
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        snapshot.write(path)
+        remove_stale_snapshots(user_id, version)
+
+    memory_cache[user_id] = snapshot
+    memory_cache.move_to_end(user_id)
+    while len(memory_cache) > SNAPSHOT_MEMORY_SLOTS:
+        memory_cache.popitem(last=False)
+    return snapshot
+
+def monthly_net(snapshot: Snapshot) -> Dict[str, np.ndarray]:
+    months = snapshot.days.astype('datetime64[D]').astype('datetime64[M]')
+    if not len(months):
+        return {'months': months, 'income': np.zeros(0, np.int64), 'expense': np.zeros(0, np.int64)}
+    index = (months - months[0]).astype(np.int64)
+    size = int(index[-1]) + 1
+    income = np.bincount(index, weights=snapshot.kopecks * snapshot.is_income, minlength=size)
+    expense = np.bincount(index, weights=snapshot.kopecks * (1 - snapshot.is_income), minlength=size)
+    return {
+        'months': months[0] + np.arange(size),
+        'income': income.astype(np.int64),
+        'expense': expense.astype(np.int64),
+    }
+
+def summarize(snapshot: Snapshot, category_names: Dict[int, str]) -> Dict[str, Any]:
+    income_mask = snapshot.is_income == 1
+    # Sums are sized by the categories present, not by the largest category id
+    category_ids, inverse = np.unique(snapshot.category_ids[~income_mask], return_inverse=True)
+    by_category = np.bincount(inverse, weights=snapshot.kopecks[~income_mask], minlength=len(category_ids))
+    categories = [
+        {'categoryId': int(category_ids[i]), 'category': category_names.get(int(category_ids[i])), 'amount': by_category[i] / 100}
+        for i in np.argsort(-by_category, kind='stable')
+    ]
+    series = monthly_net(snapshot)
+    return {
+        'income': int(snapshot.kopecks[income_mask].sum()) / 100,
+        'expense': int(snapshot.kopecks[~income_mask].sum()) / 100,
+        'count': int(len(snapshot.days)),
+        'expenseByCategory': categories,
+        'months': [
+            {'month': str(month), 'income': inc / 100, 'expense': exp / 100}
+            for month, inc, exp in zip(series['months'], series['income'], series['expense'])
+        ],
+    }
+
+def average_monthly_net(snapshot: Snapshot, months: int) -> float:
+    series = monthly_net(snapshot)
+    net = (series['income'] - series['expense'])[-months:]
+    return float(net.mean()) / 100 if len(net) else 0.0
+
+def forecast(snapshot: Snapshot, history_months: int, horizon_months: int) -> Dict[str, Any]:
+    average = average_monthly_net(snapshot, history_months)
+    balance = int(snapshot.signed_kopecks.sum()) / 100
+    return {
+        'balance': balance,
+        'averageMonthlyNet': average,
+        'projection': [
+            {'monthsAhead': step, 'balance': round(balance + average * step, 2)}
+            for step in range(1, horizon_months + 1)
+        ],
+    }
+
+def project_goals(goals: List[Dict[str, Any]], monthly_savings: float, base_currency: str) -> List[Dict[str, Any]]:
+    if not goals:
+        return []
+    today_days = np.full(len(goals), (date.today() - EPOCH).days, dtype=np.int32)
+    currency_ids = np.array([fx_table.code_id(g['currency']) for g in goals], dtype=np.int16)
+    target = fx_table.convert(np.array([float(g['target_amount']) for g in goals]), currency_ids, today_days, base_currency)
+    current = fx_table.convert(np.array([float(g['current_amount'] or 0) for g in goals]), currency_ids, today_days, base_currency)
+    remaining = np.maximum(target - current, 0)
+    months_needed = np.where(remaining == 0, 0, np.ceil(remaining / monthly_savings) if monthly_savings > 0 else np.inf)
+
+    today = date.today()
+    projections = []
+    for goal, need, target_base, current_base in zip(goals, months_needed, target, current):
+        if np.isnan(need):
+            need = np.inf
+        projected = None if np.isinf(need) else today + timedelta(days=int(need * 30.4))
+        projections.append({
+            'id': goal['id'],
+            'name': goal['name'],
+            'currency': goal['currency'],
+            'targetAmountBase': None if np.isnan(target_base) else round(float(target_base), 2),
+            'currentAmountBase': None if np.isnan(current_base) else round(float(current_base), 2),
+            'progress': float(goal['current_amount'] or 0) / float(goal['target_amount']),
+            'monthsNeeded': None if np.isinf(need) else int(need),
+            'projectedDate': projected,
+            'onTrack': projected is not None and projected <= goal['deadline'],
+        })
+    return projections
+
+def parse_query(query_params: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    # Runs before a connection is opened; unparsable numbers and dates are a 400
+    params: Dict[str, Any] = {}
+    for name, (default, low, high) in QUERY_NUMBERS.items():
+        value = query_params.get(name)
+        try:
+            number = int(value) if value not in (None, '') else default
+        except ValueError:
+            return None, f'Invalid {name}'
+        params[name] = min(max(number, low), high)
+
+    for name in ('dateFrom', 'dateTo'):
+        value = query_params.get(name) or None
+        if value:
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                return None, f'Invalid {name}'
+        params[name] = value
+    return params, None
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: User analytics (summary, forecast, goal projections) over a columnar transactions snapshot,
+              plus spending insights precomputed by the detect_spending_anomalies maintenance task
+    Args: event - dict with httpMethod, headers, queryStringParameters (view, dateFrom, dateTo, months, horizon, currency, limit)
+          context - object with request_id attribute
+    Returns: HTTP response with analytics data
+    '''
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Last-Write-At',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers = event.get('headers', {})
+    user_id = headers.get('X-User-Id') or headers.get('x-user-id')
+
+    if not user_id:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Unauthorized'}),
+            'isBase64Encoded': False
+        }
+
+    query_params = event.get('queryStringParameters') or {}
+    view = query_params.get('view', 'summary')
+
+    if method != 'GET' or view not in ('summary', 'forecast', 'goals', 'insights'):
+        return {
+            'statusCode': 405 if method != 'GET' else 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed' if method != 'GET' else 'Unknown view'}),
+            'isBase64Encoded': False
+        }
+
+    params, error = parse_query(query_params)
+    if error:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': error}),
+            'isBase64Encoded': False
+        }
+
+    conn = get_read_connection(headers)
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    try:
+        if view == 'insights':
+            # Index-only scan on idx_spending_insights_user_listing; no snapshot is needed
+            cursor.execute('''
+                SELECT month, kind, category_id, category, currency, amount, baseline, score
+                FROM spending_insights
+                WHERE user_id = %s
+                ORDER BY month DESC, score DESC
+                LIMIT %s
+            ''', (user_id, params['limit']))
+            insights = [dict(row) for row in cursor.fetchall()]
+            conn.commit()
+
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'success': True, 'view': view, 'insights': insights}, default=json_serializer),
+                'isBase64Encoded': False
+            }
+
+        cursor.execute('SELECT base_currency FROM users WHERE id = %s', (user_id,))
+        user = cursor.fetchone()
+        base_currency = (query_params.get('currency') or (user and user['base_currency']) or DEFAULT_CURRENCY).upper()
+        if fx_table.code_id(base_currency) < 0:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'Unsupported currency: {base_currency}'}),
+                'isBase64Encoded': False
+            }
+
+        stored = get_snapshot(cursor, user_id)
+        snapshot = stored.converted(base_currency)
+        history_months = params['months']
+
+        if view == 'summary':
+            window = snapshot.window(params['dateFrom'], params['dateTo'])
+            ids = [int(cid) for cid in np.unique(window.category_ids) if cid]
+            cursor.execute('SELECT id, name FROM categories WHERE id = ANY(%s)', (ids,))
+            data = summarize(window, {row['id']: row['name'] for row in cursor.fetchall()})
+        elif view == 'forecast':
+            data = forecast(snapshot, history_months, params['horizon'])
+        else:
+            cursor.execute('''
+                SELECT id, name, target_amount, current_amount, currency, deadline
+                FROM goals
+                WHERE user_id = %s AND target_amount > 0 AND deleted_at IS NULL
+                ORDER BY deadline ASC
+            ''', (user_id,))
+            goals = [dict(row) for row in cursor.fetchall()]
+            data = {'goals': project_goals(goals, average_monthly_net(snapshot, history_months), base_currency)}
+
+        conn.commit()
+
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': True, 'view': view, 'currency': base_currency, 'skippedUnknownCurrency': len(stored.days) - len(snapshot.days), 'dataVersion': snapshot.version, **data}, default=json_serializer),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        cursor.close()
+        conn.close()
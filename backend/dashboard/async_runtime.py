@@ -0,0 +1,38 @@
+'''
+Async handlers on the synchronous function runtime. One event loop per worker process runs on a
+background thread, so pools and other loop-bound state survive across warm invocations and are
+shared by concurrent callers (threads of scripts/dev_server.py).
+
+Functions are deployed independently, so this module is copied into every function directory
+that uses it. Keep the copies identical.
+
+Usage:
+    from async_runtime import sync_handler
+
+    async def async_handler(event, context): ...
+
+    handler = sync_handler(async_handler)
+'''
+
+import asyncio
+import threading
+from typing import Dict, Any, Callable, Coroutine, TypeVar
+
+T = TypeVar('T')
+AsyncHandler = Callable[[Dict[str, Any], Any], Coroutine[Any, Any, Dict[str, Any]]]
+Handler = Callable[[Dict[str, Any], Any], Dict[str, Any]]
+
+loop = asyncio.new_event_loop()
+threading.Thread(target=loop.run_forever, name='async-runtime-loop', daemon=True).start()
+
+
+def run(coroutine: Coroutine[Any, Any, T]) -> T:
+    '''Runs a coroutine on the shared loop and blocks the calling thread until it finishes'''
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+def sync_handler(async_handler: AsyncHandler) -> Handler:
+    '''Wraps an async handler into the runtime's synchronous handler(event, context)'''
+    def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return run(async_handler(event, context))
+    return handler
@@ -0,0 +1,220 @@
+'''
+Business: Combined dashboard data (premium status, recent transactions, totals, goals, organizations)
+Args: event with httpMethod, headers, queryStringParameters (dateFrom, dateTo, limit); context with request_id
+Returns: HTTP response with dashboard data
+'''
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Tuple
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from async_runtime import sync_handler
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+READ_AFTER_WRITE_SECONDS = float(os.environ.get('READ_AFTER_WRITE_SECONDS', '5'))
+
+pools: Dict[str, AsyncConnectionPool] = {}
+pools_lock: Optional[asyncio.Lock] = None
+
+
+def json_serializer(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj)} is not JSON serializable')
+
+
+def wrote_recently(headers: Dict[str, Any]) -> bool:
+    client_marker = headers.get('X-Last-Write-At') or headers.get('x-last-write-at')
+    if not client_marker or not client_marker.isdigit():
+        return False
+    return time.time() - int(client_marker) / 1000 < READ_AFTER_WRITE_SECONDS
+
+
+def parse_query(params: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    # Checked before a pooled connection is taken; dates go to SQL as date objects
+    limit = params.get('limit') or '50'
+    if not limit.isascii() or not limit.isdigit():
+        return None, 'Invalid limit'
+    query: Dict[str, Any] = {'limit': min(max(int(limit), 1), 500)}
+
+    for name in ('dateFrom', 'dateTo'):
+        value = params.get(name) or None
+        try:
+            query[name] = date.fromisoformat(value) if value else None
+        except ValueError:
+            return None, f'Invalid {name}'
+    return query, None
+
+
+async def get_pool(dsn: str) -> AsyncConnectionPool:
+    global pools_lock
+    if pools_lock is None:
+        pools_lock = asyncio.Lock()
+
+    async with pools_lock:
+        pool = pools.get(dsn)
+        if pool is None:
+            pool = AsyncConnectionPool(dsn, min_size=1, max_size=POOL_MAX_SIZE, open=False,
+                                       kwargs={'row_factory': dict_row})
+            await pool.open()
+            pools[dsn] = pool
+        return pool
+
+
+async def fetch_all(pool: AsyncConnectionPool, query: str, params: tuple) -> List[Dict[str, Any]]:
+    async with pool.connection() as conn:
+        cursor = await conn.execute(query, params)
+        return await cursor.fetchall()
+
+
+async def get_dashboard(pool: AsyncConnectionPool, user_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    date_from = params['dateFrom']
+    date_to = params['dateTo']
+    limit = params['limit']
+
+    date_filter = ''
+    date_params: tuple = ()
+    month_filter = ''
+    if date_from:
+        date_filter += ' AND date >= %s'
+        month_filter += " AND month >= date_trunc('month', %s::date)"
+        date_params += (date_from,)
+    if date_to:
+        date_filter += ' AND date <= %s'
+        month_filter += ' AND month <= %s::date'
+        date_params += (date_to,)
+
+    # Independent reads run concurrently, each on its own pooled connection
+    premium, transactions, totals, goals, organizations = await asyncio.gather(
+        fetch_all(pool, 'SELECT is_premium, premium_expires_at FROM users WHERE id = %s', (user_id,)),
+        fetch_all(pool, f'''
+            SELECT id, type, amount, currency, category, description, date, created_at
+            FROM transactions
+            WHERE user_id = %s AND amount > 0 AND deleted_at IS NULL{date_filter}
+            ORDER BY date DESC, created_at DESC
+            LIMIT %s
+        ''', (user_id,) + date_params + (limit,)),
+        # Archived months count through their rollups, at month granularity
+        fetch_all(pool, f'''
+            SELECT type, currency, SUM(total) AS total, SUM(count) AS count
+            FROM (
+                SELECT type, currency, SUM(amount) AS total, COUNT(*) AS count
+                FROM transactions
+                WHERE user_id = %s AND amount > 0 AND deleted_at IS NULL{date_filter}
+                GROUP BY type, currency
+                UNION ALL
+                SELECT type, currency, SUM(total_amount), SUM(tx_count)
+                FROM transaction_archive_rollups
+                WHERE user_id = %s{month_filter}
+                GROUP BY type, currency
+            ) totals
+            GROUP BY type, currency
+        ''', (user_id,) + date_params + (user_id,) + date_params),
+        fetch_all(pool, '''
+            SELECT id, name, target_amount, current_amount, currency, deadline, created_at
+            FROM goals
+            WHERE user_id = %s AND target_amount > 0 AND deleted_at IS NULL
+            ORDER BY deadline ASC
+        ''', (user_id,)),
+        fetch_all(pool, '''
+            SELECT id, name, type, tax_system, created_at, updated_at
+            FROM organizations
+            WHERE user_id = %s
+            ORDER BY created_at DESC
+        ''', (user_id,)),
+    )
+
+    is_premium = bool(premium) and bool(premium[0]['is_premium']) and not (
+        premium[0]['premium_expires_at'] and premium[0]['premium_expires_at'] < datetime.now()
+    )
+
+    # Sums are kept per currency; conversion into the user's base currency is the analytics function's job
+    by_type: Dict[str, Dict[str, Any]] = {}
+    for row in totals:
+        by_type.setdefault(row['type'], {})[row['currency']] = {'total': row['total'], 'count': row['count']}
+
+    return {
+        'success': True,
+        'isPremium': is_premium,
+        'transactions': transactions,
+        'totals': by_type,
+        'goals': goals,
+        'organizations': organizations,
+    }
+
+
+async def async_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Last-Write-At',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers = event.get('headers', {})
+    user_id = headers.get('X-User-Id') or headers.get('x-user-id')
+
+    if not user_id or not user_id.isascii() or not user_id.isdigit():
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Unauthorized'}),
+            'isBase64Encoded': False
+        }
+
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    query, error = parse_query(event.get('queryStringParameters') or {})
+    if error:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': error}),
+            'isBase64Encoded': False
+        }
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Database not configured'}),
+            'isBase64Encoded': False
+        }
+
+    read_dsn = os.environ.get('DATABASE_READ_URL')
+    pool = await get_pool(read_dsn if read_dsn and not wrote_recently(headers) else dsn)
+    data = await get_dashboard(pool, int(user_id), query)
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(data, default=json_serializer),
+        'isBase64Encoded': False
+    }
+
+
+# Drop-in for the runtime's synchronous entry point: requests run on the shared loop, where the
+# pools live across warm invocations
+handler = sync_handler(async_handler)
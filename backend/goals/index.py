@@ -1,15 +1,222 @@
+import base64
+import gzip
+import hashlib
 import json
 import os
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional, Tuple, List
+from collections import OrderedDict
 from datetime import datetime, date
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from decimal import Decimal
+from validation import Schema
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+READ_AFTER_WRITE_SECONDS = float(os.environ.get('READ_AFTER_WRITE_SECONDS', '5'))
+# user_id -> time of the last write from this instance, oldest first; pruned past the window
+last_write_at: 'OrderedDict[str, float]' = OrderedDict()
+
+DEFAULT_CURRENCY = 'RUB'
+# Currencies analytics can convert: the base plus every code in its FX table
+SUPPORTED_CURRENCIES = tuple(os.environ.get('SUPPORTED_CURRENCIES', 'RUB,USD,EUR,CNY').split(','))
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+GOAL_FIELDS = ('id', 'name', 'target_amount', 'current_amount', 'currency', 'deadline', 'created_at')
+GOAL_CATEGORY = 'Цели'
+CATEGORY_CACHE_MAX = 50000
+CATEGORY_CACHE_SECONDS = 300
+
+# (user_id, normalized name) -> (resolved at, category id, canonical name)
+category_cache: Dict[Tuple[str, str], Tuple[float, int, str]] = {}
+
+GOAL_SCHEMA = Schema({
+    'name': {'type': 'string', 'min_length': 1, 'max_length': 255, 'required': True, 'error': 'Invalid goal name'},
+    'targetAmount': {'type': 'decimal', 'min': 0, 'exclusive_min': True, 'required': True, 'error': 'Invalid target amount'},
+    'currentAmount': {'type': 'decimal', 'min': 0, 'default': Decimal('0'), 'error': 'Invalid current amount'},
+    'deadline': {'type': 'date', 'required': True, 'error': 'Invalid deadline'},
+    'currency': {'type': 'choice', 'values': SUPPORTED_CURRENCIES, 'default': DEFAULT_CURRENCY, 'error': 'Unsupported currency'},
+})
+
+CONTRIBUTION_SCHEMA = Schema({
+    'id': {'type': 'integer', 'required': True, 'error': 'Missing goal id'},
+    'amount': {'type': 'decimal', 'default': Decimal('0'), 'error': 'Invalid amount'},
+    'createTransaction': {'type': 'boolean', 'default': False, 'error': 'Invalid createTransaction'},
+    'category': {'type': 'string', 'max_length': 255, 'error': 'Invalid category'},
+    'date': {'type': 'date', 'error': 'Invalid date'},
+    'restore': {'type': 'boolean', 'default': False, 'error': 'Invalid restore'},
+})
+
+QUERY_SCHEMA = Schema({
+    'deletedSince': {'type': 'timestamp', 'error': 'Invalid deletedSince'},
+    'goalId': {'type': 'integer', 'error': 'Invalid goalId'},
+})
+
+DELETE_SCHEMA = Schema({
+    'id': {'type': 'integer', 'required': True, 'error': 'Missing goal id'},
+})
+
+FUNCTION_NAME = 'goals'
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
 
 def get_db_connection():
     dsn = os.environ.get('DATABASE_URL')
     return psycopg2.connect(dsn)
 
+def get_read_connection(user_id: str, headers: Dict[str, Any]):
+    read_dsn = os.environ.get('DATABASE_READ_URL')
+    if not read_dsn or wrote_recently(user_id, headers):
+        return get_db_connection()
+    return psycopg2.connect(read_dsn)
+
+def wrote_recently(user_id: str, headers: Dict[str, Any]) -> bool:
+    # Read-your-writes: stay on primary for a short window after this user's last mutation,
+    # known either from this warm instance or echoed back by the client
+    marker = last_write_at.get(user_id, 0.0)
+    client_marker = headers.get('X-Last-Write-At') or headers.get('x-last-write-at')
+    if client_marker and client_marker.isdigit():
+        marker = max(marker, int(client_marker) / 1000)
+    return time.time() - marker < READ_AFTER_WRITE_SECONDS
+
+def write_marker_headers(user_id: str) -> Dict[str, str]:
+    now = time.time()
+    last_write_at[user_id] = now
+    last_write_at.move_to_end(user_id)
+    while next(iter(last_write_at.values())) < now - READ_AFTER_WRITE_SECONDS:
+        last_write_at.popitem(last=False)
+    return {'X-Last-Write-At': str(int(now * 1000)), 'Access-Control-Expose-Headers': 'X-Last-Write-At'}
+
+def get_idempotency_key(headers: Dict[str, Any]) -> Optional[str]:
+    return headers.get('Idempotency-Key') or headers.get('idempotency-key') or None
+
+def claim_idempotency_key(cursor, scope: str, key: str, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # The claim is inserted in the request's own transaction: it commits together with the write
+    # (and its stored response) or rolls back with it, and a concurrent retry with the same key
+    # waits on the primary key until then. Returns the response to send instead, if any.
+    if len(key) > 255:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key is too long'}),
+            'isBase64Encoded': False
+        }
+    
+    request_hash = hashlib.sha256(json.dumps(
+        [event.get('httpMethod'), event.get('queryStringParameters') or {}, event.get('body') or ''], sort_keys=True
+    ).encode()).hexdigest()
+    cursor.execute('''
+        INSERT INTO idempotency_keys (function_name, scope, key, request_hash, expires_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 hour')
+        ON CONFLICT (function_name, scope, key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status_code = NULL, response_headers = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at <= CURRENT_TIMESTAMP
+        RETURNING key
+    ''', (FUNCTION_NAME, scope, key, request_hash, IDEMPOTENCY_TTL_HOURS))
+    if cursor.fetchone():
+        return None
+    
+    cursor.execute('''
+        SELECT request_hash, status_code, response_headers, response_body
+        FROM idempotency_keys
+        WHERE function_name = %s AND scope = %s AND key = %s
+    ''', (FUNCTION_NAME, scope, key))
+    stored = cursor.fetchone()
+    if stored['request_hash'] != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key was already used for a different request'}),
+            'isBase64Encoded': False
+        }
+    if stored['status_code'] is None:
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Request with this Idempotency-Key has no stored response'}),
+            'isBase64Encoded': False
+        }
+    
+    return {
+        'statusCode': stored['status_code'],
+        'headers': {
+            **stored['response_headers'],
+            'Idempotent-Replayed': 'true',
+            'Access-Control-Expose-Headers': 'X-Last-Write-At, Idempotent-Replayed'
+        },
+        'body': stored['response_body'],
+        'isBase64Encoded': False
+    }
+
+def commit_with_response(conn, cursor, scope: str, key: Optional[str], response: Dict[str, Any]) -> Dict[str, Any]:
+    # Stores the response under the claimed key before the commit, so a retry replays exactly it
+    if key:
+        cursor.execute('''
+            UPDATE idempotency_keys
+            SET status_code = %s, response_headers = %s, response_body = %s
+            WHERE function_name = %s AND scope = %s AND key = %s
+        ''', (response['statusCode'], json.dumps(response['headers']), response['body'], FUNCTION_NAME, scope, key))
+    conn.commit()
+    return response
+
+def record_change(cursor, user_id: str, entity: str, action: str, entity_ids: List[int]) -> None:
+    # Outbox row written in the mutation's own transaction; its commit wakes LISTEN change_events consumers
+    cursor.execute('''
+        INSERT INTO change_events (source, entity, action, user_id, entity_ids)
+        VALUES (%s, %s, %s, %s, %s)
+    ''', (FUNCTION_NAME, entity, action, user_id, entity_ids))
+
+def parse_fields(query_params: Dict[str, Any], allowed: Tuple[str, ...]) -> Tuple[Optional[List[str]], Optional[str]]:
+    # ?fields=id,amount,date picks columns; the whitelist also makes them safe to put into SQL
+    requested = query_params.get('fields')
+    if not requested:
+        return None, None
+    
+    fields = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if not fields or unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}" if unknown else 'Empty fields'
+    return fields, None
+
+def shape_rows(rows: List[Dict[str, Any]], fields: Optional[List[str]], columnar: bool) -> Any:
+    # Columnar shape sends each key once: {"id": [...], "amount": [...]}
+    if columnar:
+        names = fields or list(dict.fromkeys(name for row in rows for name in row))
+        return {name: [row.get(name) for row in rows] for name in names}
+    if not fields:
+        return rows
+    return [{name: row.get(name) for name in fields} for row in rows]
+
+def encode_response(headers: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    # Large bodies are compressed when the client accepts it; the gateway decodes base64 bodies
+    body = response['body']
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    
+    accept = (headers.get('Accept-Encoding') or headers.get('accept-encoding') or '').lower()
+    accepted = {
+        part.split(';')[0].strip() for part in accept.split(',')
+        if not part.replace(' ', '').endswith(('q=0', 'q=0.0'))
+    }
+    if 'br' in accepted and brotli:
+        encoding, data = 'br', brotli.compress(body.encode('utf-8'), quality=BROTLI_QUALITY)
+    elif 'gzip' in accepted:
+        encoding, data = 'gzip', gzip.compress(body.encode('utf-8'), compresslevel=GZIP_LEVEL)
+    else:
+        return response
+    
+    return {
+        **response,
+        'headers': {**response['headers'], 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'},
+        'body': base64.b64encode(data).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
 def json_serializer(obj):
     if isinstance(obj, Decimal):
         return float(obj)
@@ -17,6 +224,41 @@ def json_serializer(obj):
         return obj.isoformat()
     raise TypeError(f'Object of type {type(obj)} is not JSON serializable')
 
+def normalize_category(name: str) -> str:
+    return ' '.join(name.replace('Ё', 'Е').replace('ё', 'е').split()).lower()
+
+def resolve_category(cursor, user_id: str, name: str) -> Tuple[int, str]:
+    # A user's own category wins over a global one with the same normalized name. Entries are
+    # per user and expire, so global categories added or renamed by a migration are picked up.
+    normalized = normalize_category(name)
+    cached = category_cache.get((user_id, normalized))
+    if cached and time.time() - cached[0] < CATEGORY_CACHE_SECONDS:
+        return cached[1], cached[2]
+    
+    cursor.execute('''
+        SELECT id, name FROM categories
+        WHERE normalized_name = %s AND (user_id = %s OR user_id IS NULL)
+        ORDER BY user_id NULLS LAST
+        LIMIT 1
+    ''', (normalized, user_id))
+    row = cursor.fetchone()
+    
+    if not row:
+        # A missing global category becomes the user's own instead of failing the contribution
+        cursor.execute('''
+            INSERT INTO categories (user_id, name, normalized_name)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (user_id, normalized_name) WHERE user_id IS NOT NULL
+            DO UPDATE SET name = categories.name
+            RETURNING id, name
+        ''', (user_id, ' '.join(name.split()), normalized))
+        row = cursor.fetchone()
+    
+    if len(category_cache) >= CATEGORY_CACHE_MAX:
+        category_cache.clear()
+    category_cache[(user_id, normalized)] = (time.time(), row['id'], row['name'])
+    return row['id'], row['name']
+
 def check_premium_status(cursor, user_id: str) -> bool:
     cursor.execute('''
         SELECT is_premium, premium_expires_at 
@@ -30,16 +272,25 @@ def check_premium_status(cursor, user_id: str) -> bool:
     if not user['is_premium']:
         return False
     
+    # Expired subscriptions are flipped by the maintenance job; reads never write to users
     if user['premium_expires_at'] and user['premium_expires_at'] < datetime.now():
-        cursor.execute('UPDATE users SET is_premium = FALSE WHERE id = %s', (user_id,))
         return False
     
     return True
 
+def parse_payload(method: str, event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    # Runs before a connection is opened, so malformed writes never reach the database
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return None, 'Invalid JSON body'
+    
+    return (GOAL_SCHEMA if method == 'POST' else CONTRIBUTION_SCHEMA).validate(body)
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Manage user financial goals (CRUD + update progress)
-    Args: event - dict with httpMethod, body, headers
+    Business: Manage user financial goals (CRUD + contributions ledger)
+    Args: event - dict with httpMethod, body, headers, queryStringParameters (goalId, deletedSince, fields, format)
           context - object with request_id attribute
     Returns: HTTP response with goal data
     '''
@@ -51,7 +302,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Last-Write-At, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -69,28 +320,97 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = get_db_connection()
+    payload, error = None, None
+    if method == 'GET':
+        payload, error = QUERY_SCHEMA.validate(event.get('queryStringParameters') or {})
+    elif method in ('POST', 'PUT'):
+        payload, error = parse_payload(method, event)
+    elif method == 'DELETE':
+        payload, error = DELETE_SCHEMA.validate(event.get('queryStringParameters') or {})
+    
+    if error:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': error}),
+            'isBase64Encoded': False
+        }
+    
+    conn = get_read_connection(user_id, headers) if method == 'GET' else get_db_connection()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
         is_premium = check_premium_status(cursor, user_id)
         
+        idempotency_key = get_idempotency_key(headers) if method in ('POST', 'PUT', 'DELETE') else None
+        if idempotency_key:
+            replay = claim_idempotency_key(cursor, user_id, idempotency_key, event)
+            if replay:
+                return replay
+        
         if method == 'GET':
-            cursor.execute('''
-                SELECT id, name, target_amount, current_amount, deadline, created_at
+            query_params = event.get('queryStringParameters') or {}
+            contributions_goal_id = payload['goalId']
+            
+            # Sync: tombstones of goals deleted after the client's last sync
+            deleted_since = payload['deletedSince']
+            if deleted_since:
+                cursor.execute('''
+                    SELECT id, deleted_at
+                    FROM goals
+                    WHERE user_id = %s AND deleted_at > %s
+                    ORDER BY deleted_at
+                ''', (user_id, deleted_since))
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'success': True, 'deleted': [dict(row) for row in cursor.fetchall()]}, default=json_serializer),
+                    'isBase64Encoded': False
+                }
+            
+            if contributions_goal_id:
+                cursor.execute('''
+                    SELECT c.id, c.amount, c.transaction_id, c.transaction_date, c.created_at
+                    FROM goal_contributions c
+                    JOIN goals g ON g.id = c.goal_id
+                    WHERE c.goal_id = %s AND g.user_id = %s
+                    ORDER BY c.created_at DESC
+                ''', (contributions_goal_id, user_id))
+                
+                contributions = [dict(row) for row in cursor.fetchall()]
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'success': True, 'contributions': contributions}, default=json_serializer),
+                    'isBase64Encoded': False
+                }
+            
+            fields, error = parse_fields(query_params, GOAL_FIELDS)
+            if error:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': error}),
+                    'isBase64Encoded': False
+                }
+            
+            cursor.execute(f'''
+                SELECT {', '.join(fields or GOAL_FIELDS)}
                 FROM goals
-                WHERE user_id = %s AND target_amount > 0
+                WHERE user_id = %s AND target_amount > 0 AND deleted_at IS NULL
                 ORDER BY deadline ASC
             ''', (user_id,))
             
             goals = [dict(row) for row in cursor.fetchall()]
             
-            return {
+            return encode_response(headers, {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'goals': goals, 'isPremium': is_premium}, default=json_serializer),
+                'body': json.dumps({'success': True, 'goals': shape_rows(goals, fields, query_params.get('format') == 'columnar'), 'isPremium': is_premium}, default=json_serializer),
                 'isBase64Encoded': False
-            }
+            })
         
         elif method == 'POST':
             if not is_premium:
@@ -100,29 +420,36 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Premium subscription required', 'premiumRequired': True}),
                     'isBase64Encoded': False
                 }
-            body = json.loads(event.get('body', '{}'))
             
             cursor.execute('''
-                INSERT INTO goals (user_id, name, target_amount, current_amount, deadline)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id, name, target_amount, current_amount, deadline, created_at
+                INSERT INTO goals (user_id, name, target_amount, current_amount, deadline, currency)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id, name, target_amount, current_amount, currency, deadline, created_at
             ''', (
                 user_id,
-                body.get('name'),
-                body.get('targetAmount'),
-                body.get('currentAmount', 0),
-                body.get('deadline')
+                payload['name'],
+                payload['targetAmount'],
+                payload['currentAmount'],
+                payload['deadline'],
+                payload['currency']
             ))
             
             goal = dict(cursor.fetchone())
-            conn.commit()
             
-            return {
+            if goal['current_amount']:
+                cursor.execute('''
+                    INSERT INTO goal_contributions (goal_id, user_id, amount)
+                    VALUES (%s, %s, %s)
+                ''', (goal['id'], user_id, goal['current_amount']))
+            
+            record_change(cursor, user_id, 'goal', 'created', [goal['id']])
+            
+            return commit_with_response(conn, cursor, user_id, idempotency_key, {
                 'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(user_id)},
                 'body': json.dumps({'success': True, 'goal': goal}, default=json_serializer),
                 'isBase64Encoded': False
-            }
+            })
         
         elif method == 'PUT':
             if not is_premium:
@@ -133,20 +460,50 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            body = json.loads(event.get('body', '{}'))
-            goal_id = body.get('id')
-            amount_to_add = body.get('amount', 0)
+            goal_id = payload['id']
+            amount_to_add = payload['amount']
+            create_transaction = payload['createTransaction']
+            
+            if payload['restore']:
+                cursor.execute('''
+                    UPDATE goals
+                    SET deleted_at = NULL, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND user_id = %s AND deleted_at IS NOT NULL
+                    RETURNING id, name, target_amount, current_amount, currency, deadline, created_at
+                ''', (goal_id, user_id))
+                
+                goal = cursor.fetchone()
+                if not goal:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Deleted goal not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                record_change(cursor, user_id, 'goal', 'restored', [goal['id']])
+                
+                return commit_with_response(conn, cursor, user_id, idempotency_key, {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(user_id)},
+                    'body': json.dumps({'success': True, 'goal': dict(goal)}, default=json_serializer),
+                    'isBase64Encoded': False
+                })
             
+            # The UPDATE takes the goal row lock first and holds it until commit, so concurrent
+            # contributions serialize and the ledger row, the aggregate and the optional
+            # expense transaction commit together
             cursor.execute('''
                 UPDATE goals 
                 SET current_amount = current_amount + %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s AND user_id = %s
-                RETURNING id, name, target_amount, current_amount, deadline
+                WHERE id = %s AND user_id = %s AND deleted_at IS NULL
+                RETURNING id, name, target_amount, current_amount, currency, deadline
             ''', (amount_to_add, goal_id, user_id))
             
             goal = cursor.fetchone()
             
             if not goal:
+                conn.rollback()
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -154,14 +511,52 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            conn.commit()
+            transaction = None
+            if create_transaction and amount_to_add > 0:
+                category_id, category_name = resolve_category(cursor, user_id, payload['category'] or GOAL_CATEGORY)
+                cursor.execute('''
+                    INSERT INTO transactions (user_id, type, amount, currency, category, category_id, description, date)
+                    VALUES (%s, 'expense', %s, %s, %s, %s, %s, COALESCE(%s::date, CURRENT_DATE))
+                    RETURNING id, type, amount, currency, category, description, date, created_at
+                ''', (
+                    user_id,
+                    amount_to_add,
+                    goal['currency'],
+                    category_name,
+                    category_id,
+                    f"Пополнение цели «{goal['name']}»",
+                    payload['date']
+                ))
+                transaction = dict(cursor.fetchone())
+            
+            cursor.execute('''
+                INSERT INTO goal_contributions (goal_id, user_id, amount, transaction_id, transaction_date)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id, amount, created_at
+            ''', (
+                goal['id'],
+                user_id,
+                amount_to_add,
+                transaction['id'] if transaction else None,
+                transaction['date'] if transaction else None
+            ))
+            contribution = dict(cursor.fetchone())
+            
+            record_change(cursor, user_id, 'goal', 'contributed', [goal['id']])
+            if transaction:
+                record_change(cursor, user_id, 'transaction', 'created', [transaction['id']])
             
-            return {
+            return commit_with_response(conn, cursor, user_id, idempotency_key, {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'goal': dict(goal)}, default=json_serializer),
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(user_id)},
+                'body': json.dumps({
+                    'success': True,
+                    'goal': dict(goal),
+                    'contribution': contribution,
+                    'transaction': transaction
+                }, default=json_serializer),
                 'isBase64Encoded': False
-            }
+            })
         
         elif method == 'DELETE':
             if not is_premium:
@@ -172,20 +567,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            query_params = event.get('queryStringParameters') or {}
-            goal_id = query_params.get('id')
-            
-            if not goal_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Missing goal id'}),
-                    'isBase64Encoded': False
-                }
+            goal_id = payload['id']
             
-            cursor.execute('SELECT id FROM goals WHERE id = %s AND user_id = %s', (goal_id, user_id))
+            # Soft delete: the goal and its contributions ledger stay restorable until purged
+            cursor.execute('''
+                UPDATE goals
+                SET deleted_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND user_id = %s AND deleted_at IS NULL
+                RETURNING id
+            ''', (goal_id, user_id))
             
-            if not cursor.fetchone():
+            deleted = cursor.fetchone()
+            if not deleted:
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -193,15 +586,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            cursor.execute('DELETE FROM goals WHERE id = %s AND user_id = %s', (goal_id, user_id))
-            conn.commit()
+            record_change(cursor, user_id, 'goal', 'deleted', [deleted['id']])
             
-            return {
+            return commit_with_response(conn, cursor, user_id, idempotency_key, {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(user_id)},
                 'body': json.dumps({'success': True}),
                 'isBase64Encoded': False
-            }
+            })
         
         return {
             'statusCode': 405,
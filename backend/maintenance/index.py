@@ -0,0 +1,488 @@
+import hmac
+import io
+import json
+import os
+from datetime import date
+from typing import Dict, Any, Callable, List, Tuple, Optional
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+ANOMALY_JOB = 'spending_anomalies'
+
+def get_db_connection():
+    dsn = os.environ.get('DATABASE_URL')
+    return psycopg2.connect(dsn)
+
+def expire_premium(cursor) -> Dict[str, Any]:
+    # Matches idx_users_premium (is_premium, premium_expires_at): equality + range, single batch
+    cursor.execute('''
+        WITH expired AS (
+            UPDATE users
+            SET is_premium = FALSE, updated_at = CURRENT_TIMESTAMP
+            WHERE is_premium = TRUE AND premium_expires_at < CURRENT_TIMESTAMP
+            RETURNING id, premium_expires_at
+        ), transitions AS (
+            INSERT INTO premium_transitions (user_id, reason, premium_expires_at)
+            SELECT id, 'expired', premium_expires_at FROM expired
+        ), events AS (
+            INSERT INTO change_events (source, entity, action, entity_ids)
+            SELECT 'maintenance', 'user', 'premium_expired', array_agg(id) FROM expired
+            HAVING COUNT(*) > 0
+        )
+        SELECT COUNT(*) AS expired FROM expired
+    ''')
+    return {'expired': cursor.fetchone()['expired']}
+
+def refresh_platform_metrics(cursor) -> Dict[str, Any]:
+    # Fold the append-only delta log into daily stats; only rows logged since the last run are read
+    cursor.execute('''
+        WITH folded AS (
+            DELETE FROM transaction_stats_deltas
+            RETURNING day, type, tx_count, amount
+        )
+        INSERT INTO transaction_daily_stats (day, type, tx_count, total_amount)
+        SELECT day, type, SUM(tx_count), SUM(amount)
+        FROM folded
+        GROUP BY day, type
+        ON CONFLICT (day, type) DO UPDATE
+        SET tx_count = transaction_daily_stats.tx_count + EXCLUDED.tx_count,
+            total_amount = transaction_daily_stats.total_amount + EXCLUDED.total_amount
+    ''')
+    days_updated = cursor.rowcount
+
+    # Not incremental: both views are recomputed, rescanning users, goals and organizations on
+    # every run (transactions only for the last 30 days, through partition pruning). Their
+    # counts are not in the delta log, and transaction_daily_stats has no user dimension.
+    cursor.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY platform_metrics')
+    cursor.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY organization_metrics')
+    return {'days_updated': days_updated}
+
+def ensure_transaction_partitions(cursor) -> Dict[str, Any]:
+    months_ahead = int(os.environ.get('TRANSACTIONS_PARTITIONS_AHEAD', 3))
+    cursor.execute('SELECT ensure_transactions_partitions(CURRENT_DATE, %s) AS created', (months_ahead,))
+    return {'created': cursor.fetchone()['created']}
+
+def backfill_transactions(cursor) -> Dict[str, Any]:
+    # Online partitioning step between V0008 and V0009; a no-op once the tables are swapped
+    cursor.execute("SELECT to_regclass('transactions_partitioned') IS NOT NULL AS pending")
+    if not cursor.fetchone()['pending']:
+        return {'copied': 0}
+
+    batch_size = int(os.environ.get('TRANSACTIONS_BACKFILL_BATCH', 5000))
+    cursor.execute('SELECT backfill_transactions_partitioned(%s) AS copied', (batch_size,))
+    return {'copied': cursor.fetchone()['copied']}
+
+def reconcile_goals(cursor) -> Dict[str, Any]:
+    # Bulk verification: one grouped pass over the ledger against the maintained aggregates
+    cursor.execute('''
+        SELECT g.id
+        FROM goals g
+        LEFT JOIN (
+            SELECT goal_id, SUM(amount) AS total
+            FROM goal_contributions
+            GROUP BY goal_id
+        ) t ON t.goal_id = g.id
+        WHERE g.current_amount IS DISTINCT FROM COALESCE(t.total, 0)
+    ''')
+    mismatched = [row['id'] for row in cursor.fetchall()]
+    if not mismatched:
+        return {'mismatched': 0, 'fixed': 0}
+
+    # Contributions hold the goal row lock until commit, so once these rows are locked the next
+    # statement sees every committed ledger row and no new one can slip in between
+    cursor.execute('SELECT id FROM goals WHERE id = ANY(%s) ORDER BY id FOR UPDATE', (mismatched,))
+    cursor.execute('''
+        UPDATE goals g
+        SET current_amount = t.total, updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT ids.id AS goal_id, COALESCE(SUM(c.amount), 0) AS total
+            FROM unnest(%s::int[]) AS ids(id)
+            LEFT JOIN goal_contributions c ON c.goal_id = ids.id
+            GROUP BY ids.id
+        ) t
+        WHERE g.id = t.goal_id AND g.current_amount IS DISTINCT FROM t.total
+        RETURNING g.id
+    ''', (mismatched,))
+    fixed = [row['id'] for row in cursor.fetchall()]
+    if fixed:
+        print(f"Reconciled goal aggregates: {fixed}")
+    return {'mismatched': len(mismatched), 'fixed': len(fixed)}
+
+def expire_idempotency_keys(cursor) -> Dict[str, Any]:
+    # Range scan on idx_idempotency_keys_expires_at; batched so each DELETE stays short
+    batch_size = int(os.environ.get('IDEMPOTENCY_CLEANUP_BATCH', 5000))
+    deleted = 0
+    while True:
+        cursor.execute('''
+            DELETE FROM idempotency_keys
+            WHERE ctid = ANY(ARRAY(
+                SELECT ctid FROM idempotency_keys
+                WHERE expires_at < CURRENT_TIMESTAMP
+                LIMIT %s
+            ))
+        ''', (batch_size,))
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return {'deleted': deleted}
+        cursor.connection.commit()
+
+def expire_change_events(cursor) -> Dict[str, Any]:
+    # Past the retention window, rows are removed only once every consumer has checkpointed
+    # beyond them, so a lagging consumer keeps its backlog instead of silently losing it
+    retention_days = int(os.environ.get('CHANGE_EVENTS_RETENTION_DAYS', 7))
+    batch_size = int(os.environ.get('CHANGE_EVENTS_CLEANUP_BATCH', 5000))
+
+    cursor.execute('''
+        SELECT k.consumer
+        FROM change_event_checkpoints k
+        WHERE EXISTS (
+            SELECT 1 FROM change_events e
+            WHERE (e.txid, e.id) > (k.last_txid, k.last_id)
+              AND e.created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+        )
+        ORDER BY k.consumer
+    ''', (retention_days,))
+    lagging = [row['consumer'] for row in cursor.fetchall()]
+    if lagging:
+        print(f"Keeping expired change events for lagging consumers: {lagging}")
+
+    cursor.execute('''
+        SELECT last_txid::text AS last_txid, last_id
+        FROM change_event_checkpoints
+        ORDER BY last_txid, last_id
+        LIMIT 1
+    ''')
+    oldest = cursor.fetchone()
+    position = (oldest['last_txid'], oldest['last_id']) if oldest else (None, None)
+
+    deleted = 0
+    while True:
+        cursor.execute('''
+            DELETE FROM change_events
+            WHERE ctid = ANY(ARRAY(
+                SELECT ctid FROM change_events
+                WHERE created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                  AND (%s::xid8 IS NULL OR (txid, id) <= (%s::xid8, %s))
+                LIMIT %s
+            ))
+        ''', (retention_days, position[0], position[0], position[1], batch_size))
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return {'deleted': deleted, 'lagging': lagging}
+        cursor.connection.commit()
+
+def purge_deleted(cursor) -> Dict[str, Any]:
+    # Tombstones are kept for undo and client sync, then removed for good
+    retention_days = int(os.environ.get('SOFT_DELETE_RETENTION_DAYS', 30))
+    cursor.execute('''
+        DELETE FROM transactions
+        WHERE deleted_at IS NOT NULL AND deleted_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+    ''', (retention_days,))
+    transactions = cursor.rowcount
+    cursor.execute('''
+        DELETE FROM goals
+        WHERE deleted_at IS NOT NULL AND deleted_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+    ''', (retention_days,))
+    return {'transactions': transactions, 'goals': cursor.rowcount}
+
+def archive_transactions(cursor) -> Dict[str, Any]:
+    # Oldest month first, found through idx_transactions_date; each month commits on its own
+    after_months = int(os.environ.get('TRANSACTIONS_ARCHIVE_AFTER_MONTHS', 24))
+    months_per_run = int(os.environ.get('TRANSACTIONS_ARCHIVE_MONTHS_PER_RUN', 3))
+    archived = {}
+    for _ in range(months_per_run):
+        cursor.execute('''
+            SELECT date_trunc('month', MIN(date))::date AS month
+            FROM transactions
+            WHERE date < date_trunc('month', CURRENT_DATE) - make_interval(months => %s)
+        ''', (after_months,))
+        month = cursor.fetchone()['month']
+        if not month:
+            break
+        cursor.execute('SELECT archive_transactions_month(%s) AS archived', (month,))
+        archived[month.isoformat()] = cursor.fetchone()['archived']
+        cursor.connection.commit()
+    return {'archived': archived}
+
+def month_index(value: date) -> int:
+    # Months since 1970-01, the integer form of numpy's datetime64[M]
+    return (value.year - 1970) * 12 + value.month - 1
+
+def month_start(index: int) -> date:
+    return date(1970 + index // 12, index % 12 + 1, 1)
+
+def find_anomalies(amounts: np.ndarray, history: int, recurring: int, min_amount: int,
+                   min_score: float) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    # amounts is (series, months) of monthly spend in kopecks; every month after the first
+    # `history` is evaluated against the window right before it, for all series at once.
+    # Returns kind -> (mask, baseline, score), each (series, evaluated months).
+    hist = sliding_window_view(amounts[:, :-1], history, axis=1)
+    current = amounts[:, history:]
+
+    # Robust z-score: median and MAD ignore the odd big month inside the history window.
+    # Steady bills have MAD 0, so the scale is floored at a tenth of the median.
+    median = np.median(hist, axis=2)
+    mad = np.median(np.abs(hist - median[..., None]), axis=2)
+    scale = np.maximum(np.maximum(1.4826 * mad, 0.1 * median), 1)
+    score = (current - median) / scale
+    active = np.count_nonzero(hist, axis=2)
+    spikes = (active >= (history + 1) // 2) & (score >= min_score) & (current - median >= min_amount)
+
+    # New recurring charge: nothing in the series before, then `recurring` similar months in a row
+    recent = sliding_window_view(amounts, recurring, axis=1)[:, history - recurring + 1:]
+    earlier = hist[:, :, :history - recurring + 1]
+    lowest = recent.min(axis=2)
+    new_recurring = (
+        ~earlier.any(axis=2)
+        & (lowest >= min_amount)
+        & (recent.max(axis=2) - lowest <= 0.2 * lowest)
+    )
+
+    return {
+        'spike': (spikes, median, score),
+        'new_recurring': (new_recurring, recent.mean(axis=2), np.full(current.shape, float(recurring))),
+    }
+
+def detect_spending_anomalies(cursor) -> Dict[str, Any]:
+    # Incremental: evaluates the complete months after the last processed one, for all users in
+    # one pass. Each needs its history window, read as monthly aggregates per user, category and
+    # currency from the pruned transaction partitions and the archive rollups.
+    history = int(os.environ.get('ANOMALY_HISTORY_MONTHS', 12))
+    recurring = int(os.environ.get('ANOMALY_RECURRING_MONTHS', 3))
+    initial = int(os.environ.get('ANOMALY_INITIAL_MONTHS', 3))
+    min_amount = int(float(os.environ.get('ANOMALY_MIN_AMOUNT', 1000)) * 100)
+    min_score = float(os.environ.get('ANOMALY_MIN_SCORE', 3.5))
+    # The recurring window must fit inside the history window, or the slices in find_anomalies break
+    if history < 1 or not 1 <= recurring <= history or initial < 1 or min_amount < 0 or min_score <= 0:
+        raise ValueError(
+            f'Invalid anomaly settings: need 1 <= ANOMALY_RECURRING_MONTHS ({recurring}) <= '
+            f'ANOMALY_HISTORY_MONTHS ({history}), ANOMALY_INITIAL_MONTHS ({initial}) >= 1, '
+            f'ANOMALY_MIN_AMOUNT >= 0 and ANOMALY_MIN_SCORE ({min_score}) > 0'
+        )
+
+    cursor.execute('''
+        SELECT (date_trunc('month', CURRENT_DATE) - INTERVAL '1 month')::date AS last_complete,
+               (SELECT last_month FROM batch_job_state WHERE job = %s) AS last_month
+    ''', (ANOMALY_JOB,))
+    state = cursor.fetchone()
+    end = month_index(state['last_complete'])
+    first = month_index(state['last_month']) + 1 if state['last_month'] else end - initial + 1
+    if first > end:
+        return {'months': [], 'insights': 0}
+    start = first - history
+
+    # COPY and numpy parse the aggregates without per-row Python objects; the currency code is
+    # packed into an integer (three bytes) so every column is numeric
+    buffer = io.StringIO()
+    cursor.copy_expert(cursor.mogrify('''
+        COPY (
+            SELECT user_id, COALESCE(category_id, 0),
+                   (ascii(substr(currency, 1, 1)) << 16) + (ascii(substr(currency, 2, 1)) << 8) + ascii(substr(currency, 3, 1)),
+                   (EXTRACT(YEAR FROM month)::int - 1970) * 12 + EXTRACT(MONTH FROM month)::int - 1,
+                   ROUND(SUM(amount) * 100)::bigint
+            FROM (
+                SELECT user_id, category_id, currency, date_trunc('month', date) AS month, amount
+                FROM transactions
+                WHERE type = 'expense' AND amount > 0 AND deleted_at IS NULL
+                  AND date >= %(start)s AND date < %(stop)s
+                UNION ALL
+                SELECT user_id, category_id, currency, month, total_amount
+                FROM transaction_archive_rollups
+                WHERE type = 'expense' AND month >= %(start)s AND month < %(stop)s
+            ) expenses
+            GROUP BY 1, 2, 3, 4
+        ) TO STDOUT WITH (FORMAT csv)
+    ''', {'start': month_start(start), 'stop': month_start(end + 1)}).decode(), buffer)
+    buffer.seek(0)
+    raw = np.loadtxt(buffer, delimiter=',', dtype=np.int64, ndmin=2) if buffer.getvalue() else np.empty((0, 5), dtype=np.int64)
+
+    keys, series = np.unique(raw[:, :3], axis=0, return_inverse=True)
+    amounts = np.zeros((len(keys), end - start + 1), dtype=np.int64)
+    amounts[series.reshape(-1), raw[:, 3] - start] = raw[:, 4]
+
+    columns: Dict[str, list] = {name: [] for name in ('user_id', 'month', 'kind', 'category_id', 'currency', 'amount', 'baseline', 'score')}
+    for kind, (mask, baseline, score) in find_anomalies(amounts, history, recurring, min_amount, min_score).items():
+        rows, months = np.nonzero(mask)
+        columns['user_id'] += keys[rows, 0].tolist()
+        columns['month'] += [month_start(first + int(m)) for m in months]
+        columns['kind'] += [kind] * len(rows)
+        columns['category_id'] += keys[rows, 1].tolist()
+        columns['currency'] += [''.join(chr((int(code) >> shift) & 0xFF) for shift in (16, 8, 0)) for code in keys[rows, 2]]
+        columns['amount'] += (amounts[rows, history + months] / 100).tolist()
+        columns['baseline'] += np.round(baseline[rows, months] / 100, 2).tolist()
+        columns['score'] += np.round(score[rows, months], 2).tolist()
+
+    # The evaluated months are recomputed as a whole, so insights that no longer hold (say, after
+    # last_month was moved back for backdated rows) disappear instead of lingering
+    cursor.execute('''
+        DELETE FROM spending_insights
+        WHERE month >= %s AND month <= %s
+    ''', (month_start(first), month_start(end)))
+    removed = cursor.rowcount
+
+    if columns['user_id']:
+        cursor.execute('''
+            INSERT INTO spending_insights (user_id, month, kind, category_id, currency, category, amount, baseline, score)
+            SELECT v.user_id, v.month, v.kind, v.category_id, v.currency, c.name, v.amount, v.baseline, v.score
+            FROM unnest(%(user_id)s::int[], %(month)s::date[], %(kind)s::text[], %(category_id)s::int[],
+                        %(currency)s::text[], %(amount)s::numeric[], %(baseline)s::numeric[], %(score)s::real[])
+                 AS v(user_id, month, kind, category_id, currency, amount, baseline, score)
+            LEFT JOIN categories c ON c.id = v.category_id
+        ''', columns)
+
+    cursor.execute('''
+        INSERT INTO batch_job_state (job, last_month)
+        VALUES (%s, %s)
+        ON CONFLICT (job) DO UPDATE
+        SET last_month = EXCLUDED.last_month, updated_at = CURRENT_TIMESTAMP
+    ''', (ANOMALY_JOB, state['last_complete']))
+
+    return {
+        'months': [month_start(index).isoformat() for index in range(first, end + 1)],
+        'series': len(keys),
+        'insights': len(columns['user_id']),
+        'replaced': removed,
+    }
+
+TASKS: Dict[str, Callable[[Any], Dict[str, Any]]] = {
+    'expire_premium': expire_premium,
+    'refresh_platform_metrics': refresh_platform_metrics,
+    'ensure_transaction_partitions': ensure_transaction_partitions,
+    'backfill_transactions': backfill_transactions,
+    'reconcile_goals': reconcile_goals,
+    'expire_idempotency_keys': expire_idempotency_keys,
+    'expire_change_events': expire_change_events,
+    'purge_deleted': purge_deleted,
+    'archive_transactions': archive_transactions,
+    'detect_spending_anomalies': detect_spending_anomalies,
+}
+
+# Run when no task is named. Tasks that drop or purge data must always be named explicitly.
+DEFAULT_TASKS = [
+    'expire_premium',
+    'refresh_platform_metrics',
+    'ensure_transaction_partitions',
+    'expire_idempotency_keys',
+    'expire_change_events',
+]
+
+def parse_request(event: Dict[str, Any]) -> Tuple[List[str], Optional[str], Optional[str]]:
+    # Returns (tasks, token, error). HTTP callers send the token in X-Maintenance-Token;
+    # timer triggers carry {"task": ..., "token": ...} as their payload.
+    headers = event.get('headers') or {}
+    query_params = event.get('queryStringParameters') or {}
+    task = query_params.get('task')
+    token = headers.get('X-Maintenance-Token') or headers.get('x-maintenance-token')
+
+    if not task and event.get('body'):
+        try:
+            body = json.loads(event['body'])
+        except ValueError:
+            return [], token, 'Invalid JSON body'
+        if not isinstance(body, dict):
+            return [], token, 'Expected a JSON object'
+        task = body.get('task')
+
+    for message in event.get('messages') or []:
+        payload = (message.get('details') or {}).get('payload')
+        if not payload:
+            continue
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return [], token, 'Invalid trigger payload'
+        if not isinstance(data, dict):
+            return [], token, 'Invalid trigger payload'
+        task = task or data.get('task')
+        token = token or data.get('token')
+        break
+
+    if not task:
+        return list(DEFAULT_TASKS), token, None
+    if not isinstance(task, str):
+        return [], token, 'Task must be a comma-separated string'
+    return [name.strip() for name in task.split(',') if name.strip()], token, None
+
+def is_authorized(token: Optional[str]) -> bool:
+    # Fails closed: without MAINTENANCE_TOKEN configured nothing runs
+    expected = os.environ.get('MAINTENANCE_TOKEN')
+    return bool(expected and token and hmac.compare_digest(str(token), expected))
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Periodic maintenance jobs (see TASKS), run by timer trigger or on demand
+    Args: event - dict with httpMethod, X-Maintenance-Token header, queryStringParameters/body
+                  with optional task list, or timer trigger messages with {task, token} payload
+          context - object with request_id attribute
+    Returns: HTTP response with per-task results
+    '''
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Maintenance-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    if method not in ('GET', 'POST'):
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    tasks, token, error = parse_request(event)
+    unknown = [name for name in tasks if name not in TASKS]
+
+    if error or unknown or not tasks:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': error or (f'Unknown task: {", ".join(unknown)}' if unknown else 'No task given')}),
+            'isBase64Encoded': False
+        }
+
+    if not is_authorized(token):
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Forbidden'}),
+            'isBase64Encoded': False
+        }
+
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    try:
+        # A failing task rolls back its own uncommitted work and is reported; the rest still run
+        results = {}
+        for name in tasks:
+            try:
+                results[name] = TASKS[name](cursor)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                results[name] = {'error': f'{type(e).__name__}: {e}'}
+            print(f"Maintenance task {name}: {results[name]}")
+
+        failed = [name for name in tasks if 'error' in results[name]]
+        return {
+            'statusCode': 500 if failed else 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': not failed, 'results': results, 'failed': failed}),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        cursor.close()
+        conn.close()
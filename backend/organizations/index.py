@@ -4,17 +4,159 @@ Args: event with httpMethod, body, queryStringParameters, headers; context with
 Returns: HTTP response with organizations data
 '''
 
+import hashlib
 import json
 import os
-from typing import Dict, Any, Optional, List
-from pydantic import BaseModel, Field, ValidationError
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple
 import psycopg
+from validation import Schema
 
+READ_AFTER_WRITE_SECONDS = float(os.environ.get('READ_AFTER_WRITE_SECONDS', '5'))
+# user_id -> time of the last write from this instance, oldest first; pruned past the window
+last_write_at: 'OrderedDict[str, float]' = OrderedDict()
 
-class Organization(BaseModel):
-    name: str = Field(..., min_length=1, max_length=255)
-    type: str = Field(..., pattern='^(ИП|ООО|АО)$')
-    tax_system: Optional[str] = Field(None, pattern='^(ОСНО|УСН|ЕСХН|ПСН|НПД|АУСН)$')
+FUNCTION_NAME = 'organizations'
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+
+
+ORGANIZATION_FIELDS: Dict[str, Dict[str, Any]] = {
+    'name': {'type': 'string', 'min_length': 1, 'max_length': 255, 'required': True, 'error': 'Invalid organization name'},
+    'type': {'type': 'choice', 'values': ('ИП', 'ООО', 'АО'), 'required': True, 'error': 'Invalid organization type'},
+    'tax_system': {'type': 'choice', 'values': ('ОСНО', 'УСН', 'ЕСХН', 'ПСН', 'НПД', 'АУСН'), 'error': 'Invalid tax system'},
+}
+
+ORGANIZATION_SCHEMA = Schema(ORGANIZATION_FIELDS)
+
+ORGANIZATION_UPDATE_SCHEMA = Schema({
+    'id': {'type': 'integer', 'required': True, 'error': 'Organization ID required'},
+    **ORGANIZATION_FIELDS,
+})
+
+
+def get_read_connection(dsn: str, user_id: str, headers: Dict[str, Any]) -> psycopg.Connection:
+    read_dsn = os.environ.get('DATABASE_READ_URL')
+    if not read_dsn or wrote_recently(user_id, headers):
+        return psycopg.connect(dsn)
+    return psycopg.connect(read_dsn)
+
+
+def wrote_recently(user_id: str, headers: Dict[str, Any]) -> bool:
+    # Read-your-writes: stay on primary for a short window after this user's last mutation,
+    # known either from this warm instance or echoed back by the client
+    marker = last_write_at.get(user_id, 0.0)
+    client_marker = headers.get('X-Last-Write-At') or headers.get('x-last-write-at')
+    if client_marker and client_marker.isdigit():
+        marker = max(marker, int(client_marker) / 1000)
+    return time.time() - marker < READ_AFTER_WRITE_SECONDS
+
+
+def write_marker_headers(user_id: str) -> Dict[str, str]:
+    now = time.time()
+    last_write_at[user_id] = now
+    last_write_at.move_to_end(user_id)
+    while next(iter(last_write_at.values())) < now - READ_AFTER_WRITE_SECONDS:
+        last_write_at.popitem(last=False)
+    return {'X-Last-Write-At': str(int(now * 1000)), 'Access-Control-Expose-Headers': 'X-Last-Write-At'}
+
+
+def get_idempotency_key(headers: Dict[str, Any]) -> Optional[str]:
+    return headers.get('Idempotency-Key') or headers.get('idempotency-key') or None
+
+
+def claim_idempotency_key(conn: psycopg.Connection, scope: str, key: str, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # The claim is inserted in the request's own transaction: it commits together with the write
+    # (and its stored response) or rolls back with it, and a concurrent retry with the same key
+    # waits on the primary key until then. Returns the response to send instead, if any.
+    if len(key) > 255:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key is too long'}),
+            'isBase64Encoded': False
+        }
+    
+    request_hash = hashlib.sha256(json.dumps(
+        [event.get('httpMethod'), event.get('queryStringParameters') or {}, event.get('body') or ''], sort_keys=True
+    ).encode()).hexdigest()
+    claimed = conn.execute(
+        """
+        INSERT INTO idempotency_keys (function_name, scope, key, request_hash, expires_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 hour')
+        ON CONFLICT (function_name, scope, key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status_code = NULL, response_headers = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at <= CURRENT_TIMESTAMP
+        RETURNING key
+        """,
+        (FUNCTION_NAME, scope, key, request_hash, IDEMPOTENCY_TTL_HOURS)
+    ).fetchone()
+    if claimed:
+        return None
+    
+    stored_hash, status_code, response_headers, response_body = conn.execute(
+        "SELECT request_hash, status_code, response_headers, response_body FROM idempotency_keys "
+        "WHERE function_name = %s AND scope = %s AND key = %s",
+        (FUNCTION_NAME, scope, key)
+    ).fetchone()
+    if stored_hash != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key was already used for a different request'}),
+            'isBase64Encoded': False
+        }
+    if status_code is None:
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Request with this Idempotency-Key has no stored response'}),
+            'isBase64Encoded': False
+        }
+    
+    return {
+        'statusCode': status_code,
+        'headers': {
+            **response_headers,
+            'Idempotent-Replayed': 'true',
+            'Access-Control-Expose-Headers': 'X-Last-Write-At, Idempotent-Replayed'
+        },
+        'body': response_body,
+        'isBase64Encoded': False
+    }
+
+
+def commit_with_response(conn: psycopg.Connection, scope: str, key: Optional[str], response: Dict[str, Any]) -> Dict[str, Any]:
+    # Stores the response under the claimed key before the commit, so a retry replays exactly it
+    if key:
+        conn.execute(
+            "UPDATE idempotency_keys SET status_code = %s, response_headers = %s, response_body = %s "
+            "WHERE function_name = %s AND scope = %s AND key = %s",
+            (response['statusCode'], json.dumps(response['headers']), response['body'], FUNCTION_NAME, scope, key)
+        )
+    conn.commit()
+    return response
+
+
+def record_change(conn: psycopg.Connection, user_id: str, entity: str, action: str, entity_ids: List[int]) -> None:
+    # Outbox row written in the mutation's own transaction; its commit wakes LISTEN change_events consumers
+    conn.execute(
+        "INSERT INTO change_events (source, entity, action, user_id, entity_ids) VALUES (%s, %s, %s, %s, %s)",
+        (FUNCTION_NAME, entity, action, int(user_id), entity_ids)
+    )
+
+
+def parse_payload(method: str, event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    # Runs before a connection is opened, so malformed writes never reach the database
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return None, 'Invalid JSON body'
+    
+    schema = ORGANIZATION_SCHEMA if method == 'POST' else ORGANIZATION_UPDATE_SCHEMA
+    return schema.validate(body)
 
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -27,7 +169,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Last-Write-At, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -46,6 +188,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    # Validate the body before acquiring a connection
+    data = None
+    if method in ('POST', 'PUT'):
+        data, error = parse_payload(method, event)
+        if error:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': error}),
+                'isBase64Encoded': False
+            }
+    
     # Get database connection
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
@@ -56,21 +210,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg.connect(dsn)
+    conn = get_read_connection(dsn, user_id, headers) if method == 'GET' else psycopg.connect(dsn)
     
     try:
+        idempotency_key = get_idempotency_key(headers) if method in ('POST', 'PUT', 'DELETE') else None
+        if idempotency_key:
+            replay = claim_idempotency_key(conn, user_id, idempotency_key, event)
+            if replay:
+                return replay
+        
         if method == 'GET':
             return get_organizations(conn, user_id)
         elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            return create_organization(conn, user_id, body_data)
+            return create_organization(conn, user_id, data, idempotency_key)
         elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
-            return update_organization(conn, user_id, body_data)
+            return update_organization(conn, user_id, data, idempotency_key)
         elif method == 'DELETE':
             params = event.get('queryStringParameters', {})
             org_id = params.get('id')
-            return delete_organization(conn, user_id, org_id)
+            return delete_organization(conn, user_id, org_id, idempotency_key)
         else:
             return {
                 'statusCode': 405,
@@ -112,13 +270,13 @@ def get_organizations(conn: psycopg.Connection, user_id: str) -> Dict[str, Any]:
     }
 
 
-def create_organization(conn: psycopg.Connection, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+def create_organization(conn: psycopg.Connection, user_id: str, data: Dict[str, Any], idempotency_key: Optional[str]) -> Dict[str, Any]:
     # Check if user is premium
     cursor = conn.cursor()
-    cursor.execute("SELECT is_premium FROM users WHERE id = %s", (int(user_id),))
+    cursor.execute("SELECT is_premium, premium_expires_at FROM users WHERE id = %s", (int(user_id),))
     result = cursor.fetchone()
     
-    if not result or not result[0]:
+    if not result or not result[0] or (result[1] and result[1] < datetime.now()):
         cursor.close()
         return {
             'statusCode': 403,
@@ -127,40 +285,29 @@ def create_organization(conn: psycopg.Connection, user_id: str, data: Dict[str,
             'isBase64Encoded': False
         }
     
-    # Validate data
-    org = Organization(**data)
-    
     # Insert organization
     cursor.execute(
         "INSERT INTO organizations (user_id, name, type, tax_system) VALUES (%s, %s, %s, %s) RETURNING id",
-        (int(user_id), org.name, org.type, org.tax_system)
+        (int(user_id), data['name'], data['type'], data['tax_system'])
     )
     
     org_id = cursor.fetchone()[0]
-    conn.commit()
     cursor.close()
     
-    return {
+    record_change(conn, user_id, 'organization', 'created', [org_id])
+    
+    return commit_with_response(conn, user_id, idempotency_key, {
         'statusCode': 201,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(user_id)},
         'body': json.dumps({'success': True, 'id': org_id}),
         'isBase64Encoded': False
-    }
+    })
 
 
-def update_organization(conn: psycopg.Connection, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
-    org_id = data.get('id')
-    if not org_id:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Organization ID required'}),
-            'isBase64Encoded': False
-        }
-    
+def update_organization(conn: psycopg.Connection, user_id: str, data: Dict[str, Any], idempotency_key: Optional[str]) -> Dict[str, Any]:
     # Validate organization belongs to user
     cursor = conn.cursor()
-    cursor.execute("SELECT id FROM organizations WHERE id = %s AND user_id = %s", (int(org_id), int(user_id)))
+    cursor.execute("SELECT id FROM organizations WHERE id = %s AND user_id = %s", (data['id'], int(user_id)))
     
     if not cursor.fetchone():
         cursor.close()
@@ -171,27 +318,25 @@ def update_organization(conn: psycopg.Connection, user_id: str, data: Dict[str,
             'isBase64Encoded': False
         }
     
-    # Validate data
-    org = Organization(**{k: v for k, v in data.items() if k != 'id'})
-    
     # Update organization
     cursor.execute(
         "UPDATE organizations SET name = %s, type = %s, tax_system = %s WHERE id = %s",
-        (org.name, org.type, org.tax_system, int(org_id))
+        (data['name'], data['type'], data['tax_system'], data['id'])
     )
     
-    conn.commit()
     cursor.close()
     
-    return {
+    record_change(conn, user_id, 'organization', 'updated', [data['id']])
+    
+    return commit_with_response(conn, user_id, idempotency_key, {
         'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(user_id)},
         'body': json.dumps({'success': True}),
         'isBase64Encoded': False
-    }
+    })
 
 
-def delete_organization(conn: psycopg.Connection, user_id: str, org_id: Optional[str]) -> Dict[str, Any]:
+def delete_organization(conn: psycopg.Connection, user_id: str, org_id: Optional[str], idempotency_key: Optional[str]) -> Dict[str, Any]:
     if not org_id:
         return {
             'statusCode': 400,
@@ -212,12 +357,13 @@ def delete_organization(conn: psycopg.Connection, user_id: str, org_id: Optional
             'isBase64Encoded': False
         }
     
-    conn.commit()
     cursor.close()
     
-    return {
+    record_change(conn, user_id, 'organization', 'deleted', [int(org_id)])
+    
+    return commit_with_response(conn, user_id, idempotency_key, {
         'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(user_id)},
         'body': json.dumps({'success': True}),
         'isBase64Encoded': False
-    }
+    })
@@ -1,15 +1,238 @@
+import base64
+import gzip
+import hashlib
 import json
+import logging
 import os
-from typing import Dict, Any
+import re
+import time
+from typing import Dict, Any, Optional, Tuple, List, Pattern
+from collections import OrderedDict
 from datetime import datetime, date
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from decimal import Decimal
+from validation import Schema
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+READ_AFTER_WRITE_SECONDS = float(os.environ.get('READ_AFTER_WRITE_SECONDS', '5'))
+# user_id -> time of the last write from this instance, oldest first; pruned past the window
+last_write_at: 'OrderedDict[str, float]' = OrderedDict()
+
+FUNCTION_NAME = 'transactions'
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+
+# Must match the expressions of idx_transactions_search_fts / idx_transactions_search_trgm
+SEARCH_TEXT = "category || ' ' || COALESCE(description, '')"
+SEARCH_LIMIT_DEFAULT = 50
+SEARCH_LIMIT_MAX = 200
+
+BULK_IMPORT_MAX = 1000
+DEFAULT_CATEGORY = 'Другое'
+DEFAULT_CURRENCY = 'RUB'
+# Currencies analytics can convert: the base plus every code in its FX table
+SUPPORTED_CURRENCIES = tuple(os.environ.get('SUPPORTED_CURRENCIES', 'RUB,USD,EUR,CNY').split(','))
+CATEGORY_CACHE_MAX = 50000
+CATEGORY_CACHE_SECONDS = 300
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+TRANSACTION_FIELDS = ('id', 'type', 'amount', 'currency', 'category', 'category_id', 'description', 'date', 'created_at', 'archived')
+RULES_CACHE_SECONDS = 300
+RULES_CACHE_MAX = 1000
+RULE_FLAGS = re.IGNORECASE | re.DOTALL
+
+logger = logging.getLogger(__name__)
+
+# (user_id, normalized name) -> (resolved at, category id, canonical name)
+category_cache: Dict[Tuple[str, str], Tuple[float, int, str]] = {}
+# user_id -> (loaded at, compiled matchers, group name -> (category id, canonical name)); least recently used first
+rules_cache: 'OrderedDict[str, Tuple[float, List[Pattern], Dict[str, Tuple[int, str]]]]' = OrderedDict()
+
+TRANSACTION_SCHEMA = Schema({
+    'type': {'type': 'choice', 'values': ('income', 'expense'), 'required': True, 'error': 'Invalid transaction type'},
+    'amount': {'type': 'decimal', 'min': 0, 'exclusive_min': True, 'required': True, 'error': 'Invalid amount'},
+    'category': {'type': 'string', 'max_length': 255, 'error': 'Invalid category'},
+    'description': {'type': 'string', 'max_length': 2000, 'default': '', 'error': 'Invalid description'},
+    'date': {'type': 'date', 'required': True, 'error': 'Invalid date'},
+    'currency': {'type': 'choice', 'values': SUPPORTED_CURRENCIES, 'default': DEFAULT_CURRENCY, 'error': 'Unsupported currency'},
+}, require_any=('category', 'description'), require_any_error='Category is required')
+
+QUERY_SCHEMA = Schema({
+    'dateFrom': {'type': 'date', 'error': 'Invalid dateFrom'},
+    'dateTo': {'type': 'date', 'error': 'Invalid dateTo'},
+    'deletedSince': {'type': 'timestamp', 'error': 'Invalid deletedSince'},
+    'limit': {'type': 'integer', 'default': SEARCH_LIMIT_DEFAULT, 'error': 'Invalid limit'},
+})
+
+DELETE_SCHEMA = Schema({
+    'id': {'type': 'integer', 'required': True, 'error': 'Missing transaction id'},
+    'date': {'type': 'date', 'error': 'Invalid date'},
+})
+
+RESTORE_SCHEMA = Schema({
+    'id': {'type': 'integer', 'required': True, 'error': 'Expected id and restore'},
+    'restore': {'type': 'boolean', 'required': True, 'error': 'Expected id and restore'},
+    'date': {'type': 'date', 'error': 'Invalid date'},
+})
 
 def get_db_connection():
     dsn = os.environ.get('DATABASE_URL')
     return psycopg2.connect(dsn)
 
+def get_read_connection(user_id: str, headers: Dict[str, Any]):
+    read_dsn = os.environ.get('DATABASE_READ_URL')
+    if not read_dsn or wrote_recently(user_id, headers):
+        return get_db_connection()
+    return psycopg2.connect(read_dsn)
+
+def wrote_recently(user_id: str, headers: Dict[str, Any]) -> bool:
+    # Read-your-writes: stay on primary for a short window after this user's last mutation,
+    # known either from this warm instance or echoed back by the client
+    marker = last_write_at.get(user_id, 0.0)
+    client_marker = headers.get('X-Last-Write-At') or headers.get('x-last-write-at')
+    if client_marker and client_marker.isdigit():
+        marker = max(marker, int(client_marker) / 1000)
+    return time.time() - marker < READ_AFTER_WRITE_SECONDS
+
+def write_marker_headers(user_id: str) -> Dict[str, str]:
+    now = time.time()
+    last_write_at[user_id] = now
+    last_write_at.move_to_end(user_id)
+    while next(iter(last_write_at.values())) < now - READ_AFTER_WRITE_SECONDS:
+        last_write_at.popitem(last=False)
+    return {'X-Last-Write-At': str(int(now * 1000)), 'Access-Control-Expose-Headers': 'X-Last-Write-At'}
+
+def get_idempotency_key(headers: Dict[str, Any]) -> Optional[str]:
+    return headers.get('Idempotency-Key') or headers.get('idempotency-key') or None
+
+def claim_idempotency_key(cursor, scope: str, key: str, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # The claim is inserted in the request's own transaction: it commits together with the write
+    # (and its stored response) or rolls back with it, and a concurrent retry with the same key
+    # waits on the primary key until then. Returns the response to send instead, if any.
+    if len(key) > 255:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key is too long'}),
+            'isBase64Encoded': False
+        }
+    
+    request_hash = hashlib.sha256(json.dumps(
+        [event.get('httpMethod'), event.get('queryStringParameters') or {}, event.get('body') or ''], sort_keys=True
+    ).encode()).hexdigest()
+    cursor.execute('''
+        INSERT INTO idempotency_keys (function_name, scope, key, request_hash, expires_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 hour')
+        ON CONFLICT (function_name, scope, key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status_code = NULL, response_headers = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at <= CURRENT_TIMESTAMP
+        RETURNING key
+    ''', (FUNCTION_NAME, scope, key, request_hash, IDEMPOTENCY_TTL_HOURS))
+    if cursor.fetchone():
+        return None
+    
+    cursor.execute('''
+        SELECT request_hash, status_code, response_headers, response_body
+        FROM idempotency_keys
+        WHERE function_name = %s AND scope = %s AND key = %s
+    ''', (FUNCTION_NAME, scope, key))
+    stored = cursor.fetchone()
+    if stored['request_hash'] != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key was already used for a different request'}),
+            'isBase64Encoded': False
+        }
+    if stored['status_code'] is None:
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Request with this Idempotency-Key has no stored response'}),
+            'isBase64Encoded': False
+        }
+    
+    return {
+        'statusCode': stored['status_code'],
+        'headers': {
+            **stored['response_headers'],
+            'Idempotent-Replayed': 'true',
+            'Access-Control-Expose-Headers': 'X-Last-Write-At, Idempotent-Replayed'
+        },
+        'body': stored['response_body'],
+        'isBase64Encoded': False
+    }
+
+def commit_with_response(conn, cursor, scope: str, key: Optional[str], response: Dict[str, Any]) -> Dict[str, Any]:
+    # Stores the response under the claimed key before the commit, so a retry replays exactly it
+    if key:
+        cursor.execute('''
+            UPDATE idempotency_keys
+            SET status_code = %s, response_headers = %s, response_body = %s
+            WHERE function_name = %s AND scope = %s AND key = %s
+        ''', (response['statusCode'], json.dumps(response['headers']), response['body'], FUNCTION_NAME, scope, key))
+    conn.commit()
+    return response
+
+def record_change(cursor, user_id: str, entity: str, action: str, entity_ids: List[int]) -> None:
+    # Outbox row written in the mutation's own transaction; its commit wakes LISTEN change_events consumers
+    cursor.execute('''
+        INSERT INTO change_events (source, entity, action, user_id, entity_ids)
+        VALUES (%s, %s, %s, %s, %s)
+    ''', (FUNCTION_NAME, entity, action, user_id, entity_ids))
+
+def parse_fields(query_params: Dict[str, Any], allowed: Tuple[str, ...]) -> Tuple[Optional[List[str]], Optional[str]]:
+    # ?fields=id,amount,date picks columns; the whitelist also makes them safe to put into SQL
+    requested = query_params.get('fields')
+    if not requested:
+        return None, None
+    
+    fields = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if not fields or unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}" if unknown else 'Empty fields'
+    return fields, None
+
+def shape_rows(rows: List[Dict[str, Any]], fields: Optional[List[str]], columnar: bool) -> Any:
+    # Columnar shape sends each key once: {"id": [...], "amount": [...]}
+    if columnar:
+        names = fields or list(dict.fromkeys(name for row in rows for name in row))
+        return {name: [row.get(name) for row in rows] for name in names}
+    if not fields:
+        return rows
+    return [{name: row.get(name) for name in fields} for row in rows]
+
+def encode_response(headers: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    # Large bodies are compressed when the client accepts it; the gateway decodes base64 bodies
+    body = response['body']
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    
+    accept = (headers.get('Accept-Encoding') or headers.get('accept-encoding') or '').lower()
+    accepted = {
+        part.split(';')[0].strip() for part in accept.split(',')
+        if not part.replace(' ', '').endswith(('q=0', 'q=0.0'))
+    }
+    if 'br' in accepted and brotli:
+        encoding, data = 'br', brotli.compress(body.encode('utf-8'), quality=BROTLI_QUALITY)
+    elif 'gzip' in accepted:
+        encoding, data = 'gzip', gzip.compress(body.encode('utf-8'), compresslevel=GZIP_LEVEL)
+    else:
+        return response
+    
+    return {
+        **response,
+        'headers': {**response['headers'], 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'},
+        'body': base64.b64encode(data).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
 def json_serializer(obj):
     if isinstance(obj, Decimal):
         return float(obj)
@@ -30,16 +253,182 @@ def check_premium_status(cursor, user_id: str) -> bool:
     if not user['is_premium']:
         return False
     
+    # Expired subscriptions are flipped by the maintenance job; reads never write to users
     if user['premium_expires_at'] and user['premium_expires_at'] < datetime.now():
-        cursor.execute('UPDATE users SET is_premium = FALSE WHERE id = %s', (user_id,))
         return False
     
     return True
 
+def parse_payload(method: str, event: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    # Runs before a connection is opened, so malformed writes never reach the database
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return None, 'Invalid JSON body'
+    
+    if method == 'PUT':
+        payload, error = RESTORE_SCHEMA.validate(body)
+        if payload and not payload['restore']:
+            return None, 'Expected id and restore'
+        return payload, error
+    
+    if isinstance(body, dict) and isinstance(body.get('transactions'), list):
+        items, error = TRANSACTION_SCHEMA.validate_many(body['transactions'], BULK_IMPORT_MAX, 'Transaction')
+        return (None, error) if error else ({'items': items, 'is_bulk': True}, None)
+    
+    item, error = TRANSACTION_SCHEMA.validate(body)
+    return (None, error) if error else ({'items': [item], 'is_bulk': False}, None)
+
+def normalize_category(name: str) -> str:
+    return ' '.join(name.replace('Ё', 'Е').replace('ё', 'е').split()).lower()
+
+def resolve_category(cursor, user_id: str, name: str) -> Tuple[int, str]:
+    # A user's own category wins over a global one with the same normalized name. Entries are
+    # per user and expire, so global categories added or renamed by a migration are picked up.
+    normalized = normalize_category(name)
+    cached = category_cache.get((user_id, normalized))
+    if cached and time.time() - cached[0] < CATEGORY_CACHE_SECONDS:
+        return cached[1], cached[2]
+    
+    cursor.execute('''
+        SELECT id, name FROM categories
+        WHERE normalized_name = %s AND (user_id = %s OR user_id IS NULL)
+        ORDER BY user_id NULLS LAST
+        LIMIT 1
+    ''', (normalized, user_id))
+    row = cursor.fetchone()
+    
+    if not row:
+        cursor.execute('''
+            INSERT INTO categories (user_id, name, normalized_name)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (user_id, normalized_name) WHERE user_id IS NOT NULL
+            DO UPDATE SET name = categories.name
+            RETURNING id, name
+        ''', (user_id, ' '.join(name.split()), normalized))
+        row = cursor.fetchone()
+    
+    if len(category_cache) >= CATEGORY_CACHE_MAX:
+        category_cache.clear()
+    category_cache[(user_id, normalized)] = (time.time(), row['id'], row['name'])
+    return row['id'], row['name']
+
+def get_rule_matcher(cursor, user_id: str) -> Tuple[List[Pattern], Dict[str, Tuple[int, str]]]:
+    cached = rules_cache.get(user_id)
+    if cached and time.time() - cached[0] < RULES_CACHE_SECONDS:
+        rules_cache.move_to_end(user_id)
+        return cached[1], cached[2]
+    
+    cursor.execute('''
+        SELECT r.pattern, c.id AS category_id, c.name
+        FROM category_rules r
+        JOIN categories c ON c.id = r.category_id
+        WHERE r.user_id IS NULL OR r.user_id = %s
+        ORDER BY r.user_id NULLS LAST, r.priority DESC, r.id
+    ''', (user_id,))
+    
+    # All rules compile into one pattern: each alternative is a lookahead anchored at the start,
+    # so a single match call returns the first rule (in priority order) found anywhere in the text
+    alternatives = []
+    groups = {}
+    for index, row in enumerate(cursor.fetchall()):
+        group = f'r{index}'
+        alternative = f"(?=.*?(?P<{group}>{row['pattern']}))"
+        try:
+            re.compile(alternative, RULE_FLAGS)
+        except (re.error, RecursionError, OverflowError) as e:
+            logger.warning('Skipping category rule %r for user %s: %s', row['pattern'], user_id, e)
+            continue
+        alternatives.append(alternative)
+        groups[group] = (row['category_id'], row['name'])
+    
+    # Rules that compile alone can still fail together (pattern size limits); match them one
+    # by one in the same priority order then
+    matchers = []
+    if alternatives:
+        try:
+            matchers = [re.compile('|'.join(alternatives), RULE_FLAGS)]
+        except (re.error, RecursionError, OverflowError) as e:
+            logger.warning('Matching %d category rules one by one for user %s: %s', len(alternatives), user_id, e)
+            matchers = [re.compile(alternative, RULE_FLAGS) for alternative in alternatives]
+    
+    rules_cache[user_id] = (time.time(), matchers, groups)
+    rules_cache.move_to_end(user_id)
+    if len(rules_cache) > RULES_CACHE_MAX:
+        rules_cache.popitem(last=False)
+    return matchers, groups
+
+def categorize(cursor, user_id: str, category: Optional[str], description: str) -> Tuple[int, str]:
+    if category and normalize_category(category) != normalize_category(DEFAULT_CATEGORY):
+        return resolve_category(cursor, user_id, category)
+    
+    matchers, groups = get_rule_matcher(cursor, user_id)
+    if description:
+        for matcher in matchers:
+            match = matcher.match(description)
+            if match and match.lastgroup:
+                return groups[match.lastgroup]
+    
+    return resolve_category(cursor, user_id, DEFAULT_CATEGORY)
+
+def search_transactions(cursor, user_id: str, query: str, date_filter: str, date_params: list, limit: int) -> list:
+    # Full-text match ranked by ts_rank_cd; highlighting runs only on the rows that survive LIMIT
+    cursor.execute(f'''
+        SELECT id, type, amount, currency, category, description, date, created_at, rank,
+               ts_headline('russian', {SEARCH_TEXT}, query, 'StartSel=<mark>, StopSel=</mark>, MaxFragments=2') AS highlight
+        FROM (
+            SELECT t.id, t.type, t.amount, t.currency, t.category, t.description, t.date, t.created_at, q.query,
+                   ts_rank_cd(to_tsvector('russian', {SEARCH_TEXT}), q.query) AS rank
+            FROM transactions t, websearch_to_tsquery('russian', %s) AS q(query)
+            WHERE user_id = %s AND amount > 0 AND deleted_at IS NULL{date_filter}
+              AND to_tsvector('russian', {SEARCH_TEXT}) @@ q.query
+            ORDER BY rank DESC, date DESC
+            LIMIT %s
+        ) ranked
+        ORDER BY rank DESC, date DESC
+    ''', [query, user_id] + date_params + [limit])
+    rows = [dict(row) for row in cursor.fetchall()]
+    if rows:
+        return rows
+    
+    # Nothing matched whole words: fall back to trigram word similarity for typos and fragments
+    cursor.execute(f'''
+        SELECT id, type, amount, currency, category, description, date, created_at,
+               word_similarity(%s, {SEARCH_TEXT}) AS rank, NULL AS highlight
+        FROM transactions
+        WHERE user_id = %s AND amount > 0 AND deleted_at IS NULL{date_filter}
+          AND %s <%% ({SEARCH_TEXT})
+        ORDER BY rank DESC, date DESC
+        LIMIT %s
+    ''', [query, user_id] + date_params + [query, limit])
+    return [dict(row) for row in cursor.fetchall()]
+
+def load_archived(cursor, user_id: str, date_from: Optional[date], date_to: Optional[date]) -> list:
+    # Archived months are expanded from their JSONB arrays only on request; the (user_id, month)
+    # primary key limits the read to the months in range
+    filters = ''
+    params: list = [user_id]
+    if date_from:
+        filters += " AND a.month >= date_trunc('month', %s::date) AND r.date >= %s"
+        params += [date_from, date_from]
+    if date_to:
+        filters += ' AND a.month <= %s::date AND r.date <= %s'
+        params += [date_to, date_to]
+    
+    cursor.execute(f'''
+        SELECT r.id, r.type, r.amount, r.currency, r.category, r.category_id, r.description, r.date, r.created_at,
+               TRUE AS archived
+        FROM transactions_archive a,
+             jsonb_to_recordset(a.rows) AS r(id INTEGER, type VARCHAR, amount DECIMAL, currency CHAR(3), category VARCHAR,
+                                              category_id INTEGER, description TEXT, date DATE, created_at TIMESTAMP)
+        WHERE a.user_id = %s AND r.amount > 0{filters}
+    ''', params)
+    return [dict(row) for row in cursor.fetchall()]
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Manage user transactions (CRUD operations)
-    Args: event - dict with httpMethod, body, headers
+    Args: event - dict with httpMethod, body, headers, queryStringParameters (dateFrom, dateTo, q, limit, includeArchived, deletedSince, fields, format)
           context - object with request_id attribute
     Returns: HTTP response with transaction data
     '''
@@ -50,8 +439,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Last-Write-At, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -69,28 +458,112 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = get_db_connection()
+    payload, error = None, None
+    if method == 'GET':
+        payload, error = QUERY_SCHEMA.validate(event.get('queryStringParameters') or {})
+    elif method in ('POST', 'PUT'):
+        payload, error = parse_payload(method, event)
+    elif method == 'DELETE':
+        payload, error = DELETE_SCHEMA.validate(event.get('queryStringParameters') or {})
+    
+    if error:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': error, 'success': False}),
+            'isBase64Encoded': False
+        }
+    
+    conn = get_read_connection(user_id, headers) if method == 'GET' else get_db_connection()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
         is_premium = check_premium_status(cursor, user_id)
         
+        idempotency_key = get_idempotency_key(headers) if method in ('POST', 'PUT', 'DELETE') else None
+        if idempotency_key:
+            replay = claim_idempotency_key(cursor, user_id, idempotency_key, event)
+            if replay:
+                return replay
+        
         if method == 'GET':
-            cursor.execute('''
-                SELECT id, type, amount, category, description, date, created_at
+            query_params = event.get('queryStringParameters') or {}
+            date_from = payload['dateFrom']
+            date_to = payload['dateTo']
+            columnar = query_params.get('format') == 'columnar'
+            fields, error = parse_fields(query_params, TRANSACTION_FIELDS)
+            
+            if error:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': error}),
+                    'isBase64Encoded': False
+                }
+            
+            # Sync: tombstones of rows deleted after the client's last sync
+            deleted_since = payload['deletedSince']
+            if deleted_since:
+                cursor.execute('''
+                    SELECT id, date, deleted_at
+                    FROM transactions
+                    WHERE user_id = %s AND deleted_at > %s
+                    ORDER BY deleted_at
+                ''', (user_id, deleted_since))
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'success': True, 'deleted': [dict(row) for row in cursor.fetchall()]}, default=json_serializer),
+                    'isBase64Encoded': False
+                }
+            
+            # Date bounds are sent as literals so the planner prunes to the matching monthly partitions
+            date_filter = ''
+            date_params = []
+            if date_from:
+                date_filter += ' AND date >= %s'
+                date_params.append(date_from)
+            if date_to:
+                date_filter += ' AND date <= %s'
+                date_params.append(date_to)
+            
+            search_query = (query_params.get('q') or '').strip()
+            if search_query:
+                limit = min(payload['limit'], SEARCH_LIMIT_MAX)
+                results = search_transactions(cursor, user_id, search_query, date_filter, date_params, limit)
+                
+                return encode_response(headers, {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'success': True, 'transactions': shape_rows(results, fields, columnar), 'isPremium': is_premium}, default=json_serializer),
+                    'isBase64Encoded': False
+                })
+            
+            # Narrow selections can be served from idx_transactions_user_live alone; date and
+            # created_at are always read for the archive merge below
+            columns = [name for name in fields or TRANSACTION_FIELDS if name != 'archived']
+            columns = ', '.join(dict.fromkeys(columns + ['date', 'created_at']))
+            
+            cursor.execute(f'''
+                SELECT {columns}
                 FROM transactions
-                WHERE user_id = %s AND amount > 0
+                WHERE user_id = %s AND amount > 0 AND deleted_at IS NULL{date_filter}
                 ORDER BY date DESC, created_at DESC
-            ''', (user_id,))
+            ''', [user_id] + date_params)
             
             transactions = [dict(row) for row in cursor.fetchall()]
             
-            return {
+            if query_params.get('includeArchived') == 'true':
+                transactions += load_archived(cursor, user_id, date_from, date_to)
+                transactions.sort(key=lambda t: (t['date'], t['created_at'] or datetime.min), reverse=True)
+            
+            return encode_response(headers, {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'transactions': transactions, 'isPremium': is_premium}, default=json_serializer),
+                'body': json.dumps({'success': True, 'transactions': shape_rows(transactions, fields, columnar), 'isPremium': is_premium}, default=json_serializer),
                 'isBase64Encoded': False
-            }
+            })
         
         elif method == 'POST':
             if not is_premium:
@@ -102,59 +575,37 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             try:
-                body = json.loads(event.get('body', '{}'))
+                is_bulk = payload['is_bulk']
+                rows = []
+                for item in payload['items']:
+                    category_id, category_name = categorize(cursor, user_id, item['category'], item['description'])
+                    rows.append((
+                        user_id,
+                        item['type'],
+                        item['amount'],
+                        category_name,
+                        category_id,
+                        item['description'],
+                        item['date'],
+                        item['currency']
+                    ))
                 
-                trans_type = body.get('type')
-                amount = body.get('amount')
-                category = body.get('category')
-                date_val = body.get('date')
+                created = execute_values(cursor, '''
+                    INSERT INTO transactions (user_id, type, amount, category, category_id, description, date, currency)
+                    VALUES %s
+                    RETURNING id, type, amount, currency, category, category_id, description, date, created_at
+                ''', rows, fetch=True)
                 
-                if not trans_type or trans_type not in ['income', 'expense']:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Invalid transaction type', 'success': False}),
-                        'isBase64Encoded': False
-                    }
+                transactions = [dict(row) for row in created]
+                record_change(cursor, user_id, 'transaction', 'created', [row['id'] for row in transactions])
+                result = {'success': True, 'transactions': transactions} if is_bulk else {'success': True, 'transaction': transactions[0]}
                 
-                if not amount or float(amount) <= 0:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Invalid amount', 'success': False}),
-                        'isBase64Encoded': False
-                    }
-                
-                if not category:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Category is required', 'success': False}),
-                        'isBase64Encoded': False
-                    }
-                
-                cursor.execute('''
-                    INSERT INTO transactions (user_id, type, amount, category, description, date)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    RETURNING id, type, amount, category, description, date, created_at
-                ''', (
-                    user_id,
-                    trans_type,
-                    float(amount),
-                    category,
-                    body.get('description', ''),
-                    date_val
-                ))
-                
-                transaction = dict(cursor.fetchone())
-                conn.commit()
-                
-                return {
+                return commit_with_response(conn, cursor, user_id, idempotency_key, {
                     'statusCode': 201,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'success': True, 'transaction': transaction}, default=json_serializer),
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(user_id)},
+                    'body': json.dumps(result, default=json_serializer),
                     'isBase64Encoded': False
-                }
+                })
             except Exception as e:
                 conn.rollback()
                 return {
@@ -173,38 +624,75 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            query_params = event.get('queryStringParameters') or {}
-            transaction_id = query_params.get('id')
+            transaction_id = payload['id']
+            date_val = payload['date']
+            
+            # The optional date narrows the lookup to a single partition
+            date_filter = ' AND date = %s' if date_val else ''
+            params = (transaction_id, user_id, date_val) if date_val else (transaction_id, user_id)
             
-            if not transaction_id:
+            # Soft delete: the tombstone serves undo (PUT with restore) and sync until it is purged
+            cursor.execute(f'''
+                UPDATE transactions
+                SET deleted_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND user_id = %s AND deleted_at IS NULL{date_filter}
+                RETURNING id
+            ''', params)
+            
+            deleted = cursor.fetchone()
+            if not deleted:
                 return {
-                    'statusCode': 400,
+                    'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Missing transaction id'}),
+                    'body': json.dumps({'error': 'Transaction not found'}),
                     'isBase64Encoded': False
                 }
             
-            cursor.execute('''
-                SELECT id FROM transactions WHERE id = %s AND user_id = %s
-            ''', (transaction_id, user_id))
+            record_change(cursor, user_id, 'transaction', 'deleted', [deleted['id']])
             
-            if not cursor.fetchone():
+            return commit_with_response(conn, cursor, user_id, idempotency_key, {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(user_id)},
+                'body': json.dumps({'success': True}),
+                'isBase64Encoded': False
+            })
+        
+        elif method == 'PUT':
+            if not is_premium:
+                return {
+                    'statusCode': 403,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Premium subscription required', 'premiumRequired': True}),
+                    'isBase64Encoded': False
+                }
+            
+            date_filter = ' AND date = %s' if payload['date'] else ''
+            params = (payload['id'], user_id, payload['date']) if payload['date'] else (payload['id'], user_id)
+            
+            cursor.execute(f'''
+                UPDATE transactions
+                SET deleted_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND user_id = %s AND deleted_at IS NOT NULL{date_filter}
+                RETURNING id, type, amount, currency, category, category_id, description, date, created_at
+            ''', params)
+            
+            transaction = cursor.fetchone()
+            if not transaction:
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Transaction not found'}),
+                    'body': json.dumps({'error': 'Deleted transaction not found'}),
                     'isBase64Encoded': False
                 }
             
-            cursor.execute('DELETE FROM transactions WHERE id = %s AND user_id = %s', (transaction_id, user_id))
-            conn.commit()
+            record_change(cursor, user_id, 'transaction', 'restored', [transaction['id']])
             
-            return {
+            return commit_with_response(conn, cursor, user_id, idempotency_key, {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True}),
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_marker_headers(user_id)},
+                'body': json.dumps({'success': True, 'transaction': dict(transaction)}, default=json_serializer),
                 'isBase64Encoded': False
-            }
+            })
         
         return {
             'statusCode': 405,
@@ -0,0 +1,189 @@
+'''
+Request validation: declarative field specs compiled once at import into flat lists of checks.
+Handlers validate payloads before opening a database connection and get back cleaned values
+(amounts as Decimal, dates as date, timestamps as datetime), so nothing downstream re-parses
+them.
+
+Functions are deployed independently, so this module is copied into every function directory
+that uses it (transactions, goals, organizations). Keep the copies identical.
+'''
+
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+Check = Callable[[Any], Any]
+
+INT4_MAX = 2 ** 31 - 1
+DIGITS = re.compile(r'[0-9]+')
+ISO_DATE = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}(?:$|T)')
+
+
+class Invalid(Exception):
+    pass
+
+
+def _parse_datetime(value: str) -> datetime:
+    # fromisoformat only takes a trailing Z from Python 3.11 on
+    return datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+
+
+def _string(spec: Dict[str, Any]) -> Check:
+    min_length = spec.get('min_length', 0)
+    max_length = spec.get('max_length')
+    pattern = re.compile(spec['pattern']) if 'pattern' in spec else None
+
+    def check(value: Any) -> str:
+        if not isinstance(value, str):
+            raise Invalid
+        value = value.strip() if spec.get('strip', True) else value
+        if len(value) < min_length or (max_length is not None and len(value) > max_length):
+            raise Invalid
+        if pattern and not pattern.match(value):
+            raise Invalid
+        return value
+    return check
+
+
+def _choice(spec: Dict[str, Any]) -> Check:
+    values = frozenset(spec['values'])
+
+    def check(value: Any) -> str:
+        if value not in values:
+            raise Invalid
+        return value
+    return check
+
+
+def _decimal(spec: Dict[str, Any]) -> Check:
+    minimum = Decimal(str(spec['min'])) if 'min' in spec else None
+    exclusive = spec.get('exclusive_min', False)
+    maximum = Decimal(str(spec.get('max', '9999999999999.99')))
+    quantum = Decimal('0.01')
+
+    def check(value: Any) -> Decimal:
+        if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+            raise Invalid
+        try:
+            number = Decimal(str(value)).quantize(quantum)
+        except InvalidOperation:
+            raise Invalid
+        if not number.is_finite() or number > maximum:
+            raise Invalid
+        if minimum is not None and (number <= minimum if exclusive else number < minimum):
+            raise Invalid
+        return number
+    return check
+
+
+def _integer(spec: Dict[str, Any]) -> Check:
+    # Ids are SERIAL (int4) unless the spec sets max; a wider value would fail in Postgres instead
+    maximum = spec.get('max', INT4_MAX)
+
+    def check(value: Any) -> int:
+        if isinstance(value, bool):
+            raise Invalid
+        if isinstance(value, str) and DIGITS.fullmatch(value):
+            value = int(value)
+        if not isinstance(value, int) or not 0 < value <= maximum:
+            raise Invalid
+        return value
+    return check
+
+
+def _date(spec: Dict[str, Any]) -> Check:
+    # A plain YYYY-MM-DD, or a complete ISO timestamp whose date part is taken
+    def check(value: Any) -> date:
+        if not isinstance(value, str) or not ISO_DATE.match(value):
+            raise Invalid
+        try:
+            if len(value) == 10:
+                return date.fromisoformat(value)
+            return _parse_datetime(value).date()
+        except ValueError:
+            raise Invalid
+    return check
+
+
+def _timestamp(spec: Dict[str, Any]) -> Check:
+    def check(value: Any) -> datetime:
+        if not isinstance(value, str):
+            raise Invalid
+        try:
+            return _parse_datetime(value)
+        except ValueError:
+            raise Invalid
+    return check
+
+
+def _boolean(spec: Dict[str, Any]) -> Check:
+    def check(value: Any) -> bool:
+        if not isinstance(value, bool):
+            raise Invalid
+        return value
+    return check
+
+
+FIELD_TYPES: Dict[str, Callable[[Dict[str, Any]], Check]] = {
+    'string': _string,
+    'choice': _choice,
+    'decimal': _decimal,
+    'integer': _integer,
+    'date': _date,
+    'timestamp': _timestamp,
+    'boolean': _boolean,
+}
+
+
+class Schema:
+    '''Compiled form of a {field: spec} mapping.
+
+    Spec keys: type (see FIELD_TYPES), required, default, error (message for this field) and
+    the per-type limits (min_length, max_length, pattern, values, min, exclusive_min, max).
+    require_any lists fields of which at least one must be present.'''
+
+    def __init__(self, fields: Dict[str, Dict[str, Any]], require_any: Tuple[str, ...] = (),
+                 require_any_error: str = 'Missing required field'):
+        self.fields: List[Tuple[str, Check, bool, Any, str]] = [
+            (name, FIELD_TYPES[spec['type']](spec), spec.get('required', False), spec.get('default'),
+             spec.get('error', f'Invalid {name}'))
+            for name, spec in fields.items()
+        ]
+        self.require_any = require_any
+        self.require_any_error = require_any_error
+
+    def validate(self, data: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        '''Returns (cleaned values, None) or (None, error message). Unknown keys are dropped.'''
+        if not isinstance(data, dict):
+            return None, 'Expected a JSON object'
+
+        cleaned: Dict[str, Any] = {}
+        for name, check, required, default, error in self.fields:
+            value = data.get(name)
+            if value is None or value == '':
+                if required:
+                    return None, error
+                cleaned[name] = default
+                continue
+            try:
+                cleaned[name] = check(value)
+            except Invalid:
+                return None, error
+
+        if self.require_any and all(cleaned[name] in (None, '') for name in self.require_any):
+            return None, self.require_any_error
+        return cleaned, None
+
+    def validate_many(self, items: Any, max_items: int, label: str = 'Item') -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+        '''Validates a list in one pass; the error names the first bad item by index.'''
+        if not isinstance(items, list) or not 1 <= len(items) <= max_items:
+            return None, f'Expected 1 to {max_items} {label.lower()}s'
+
+        cleaned = []
+        for index, item in enumerate(items):
+            values, error = self.validate(item)
+            if error:
+                return None, f'{label} {index}: {error}'
+            cleaned.append(values)
+        return cleaned, None
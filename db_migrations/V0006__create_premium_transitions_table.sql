@@ -0,0 +1,10 @@
+-- Audit log of premium status changes made by the scheduled maintenance job
+CREATE TABLE IF NOT EXISTS premium_transitions (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    reason VARCHAR(20) NOT NULL,
+    premium_expires_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_premium_transitions_user_id ON premium_transitions(user_id);
@@ -0,0 +1,70 @@
+-- Precomputed platform metrics for the admin dashboard.
+-- Transaction volume is maintained incrementally: a trigger appends per-row deltas to an
+-- append-only log (no hot-row contention on inserts), and the maintenance job folds the log
+-- into transaction_daily_stats. User, goal and organization metrics live in materialized
+-- views refreshed by the same job, so dashboard reads never touch transactions or goals.
+
+CREATE TABLE IF NOT EXISTS transaction_daily_stats (
+    day DATE NOT NULL,
+    type VARCHAR(10) NOT NULL,
+    tx_count BIGINT NOT NULL DEFAULT 0,
+    total_amount DECIMAL(18, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, type)
+);
+
+CREATE TABLE IF NOT EXISTS transaction_stats_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    day DATE NOT NULL,
+    type VARCHAR(10) NOT NULL,
+    tx_count INTEGER NOT NULL,
+    amount DECIMAL(15, 2) NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION log_transaction_stats_delta() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO transaction_stats_deltas (day, type, tx_count, amount)
+        VALUES (OLD.date, OLD.type, -1, -OLD.amount);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO transaction_stats_deltas (day, type, tx_count, amount)
+        VALUES (NEW.date, NEW.type, 1, NEW.amount);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_transactions_stats_delta ON transactions;
+CREATE TRIGGER trg_transactions_stats_delta
+    AFTER INSERT OR UPDATE OF date, type, amount OR DELETE ON transactions
+    FOR EACH ROW EXECUTE FUNCTION log_transaction_stats_delta();
+
+-- Seed the summary from existing history once
+INSERT INTO transaction_daily_stats (day, type, tx_count, total_amount)
+SELECT date, type, COUNT(*), SUM(amount)
+FROM transactions
+GROUP BY date, type
+ON CONFLICT (day, type) DO NOTHING;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS platform_metrics AS
+SELECT
+    1 AS id,
+    (SELECT COUNT(*) FROM users WHERE email IS NOT NULL) AS total_users,
+    (SELECT COUNT(*) FROM users
+        WHERE email IS NOT NULL AND is_premium = TRUE
+          AND (premium_expires_at IS NULL OR premium_expires_at >= CURRENT_TIMESTAMP)) AS premium_users,
+    (SELECT COUNT(DISTINCT user_id) FROM transactions
+        WHERE date >= CURRENT_DATE - 30) AS active_users_30d,
+    (SELECT COUNT(*) FROM goals WHERE target_amount > 0) AS total_goals,
+    (SELECT COUNT(*) FROM goals
+        WHERE target_amount > 0 AND current_amount >= target_amount) AS completed_goals,
+    CURRENT_TIMESTAMP AS refreshed_at;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_platform_metrics_id ON platform_metrics(id);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS organization_metrics AS
+SELECT type, COALESCE(tax_system, '') AS tax_system, COUNT(*) AS organizations_count
+FROM organizations
+GROUP BY type, COALESCE(tax_system, '');
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_organization_metrics_key ON organization_metrics(type, tax_system);
@@ -0,0 +1,125 @@
+-- Step 1 of the online move of transactions to monthly range partitions on date.
+-- Creates the partitioned shadow table, keeps it in sync with a dual-write trigger and
+-- provides a batched backfill. Step 2 (V0009) swaps the tables; see README "Transactions
+-- partitioning" for the rollout order on large tables.
+
+CREATE TABLE IF NOT EXISTS transactions_partitioned (
+    id INTEGER NOT NULL DEFAULT nextval('transactions_id_seq'),
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    type VARCHAR(10) NOT NULL CHECK (type IN ('income', 'expense')),
+    amount DECIMAL(15, 2) NOT NULL,
+    category VARCHAR(255) NOT NULL,
+    description TEXT,
+    date DATE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+CREATE TABLE IF NOT EXISTS transactions_default PARTITION OF transactions_partitioned DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_transactions_p_user_id ON transactions_partitioned(user_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_p_date ON transactions_partitioned(date);
+
+-- Creates missing monthly partitions from from_date up to months_ahead months past the current
+-- month. Rows already parked in the default partition for a new month are moved into it.
+CREATE OR REPLACE FUNCTION ensure_transactions_partitions(from_date DATE, months_ahead INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    parent TEXT;
+    month_start DATE := date_trunc('month', from_date)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    next_month DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    SELECT CASE WHEN relkind = 'p' THEN 'transactions' ELSE 'transactions_partitioned' END
+    INTO parent
+    FROM pg_class WHERE oid = 'transactions'::regclass;
+
+    WHILE month_start <= last_month LOOP
+        next_month := (month_start + INTERVAL '1 month')::date;
+        partition_name := 'transactions_p' || to_char(month_start, 'YYYY_MM');
+
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                           partition_name, parent);
+            EXECUTE format('WITH moved AS (DELETE FROM transactions_default WHERE date >= %L AND date < %L RETURNING *) '
+                           'INSERT INTO %I SELECT * FROM moved',
+                           month_start, next_month, partition_name);
+            EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           parent, partition_name, month_start, next_month);
+            created := created + 1;
+        END IF;
+
+        month_start := next_month;
+    END LOOP;
+
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_transactions_partitions(COALESCE((SELECT MIN(date) FROM transactions), CURRENT_DATE), 3);
+
+-- Dual write: every change to the legacy heap is mirrored into the partitioned table
+CREATE OR REPLACE FUNCTION mirror_transactions_to_partitioned() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO transactions_partitioned (id, user_id, type, amount, category, description, date, created_at, updated_at)
+        VALUES (NEW.id, NEW.user_id, NEW.type, NEW.amount, NEW.category, NEW.description, NEW.date, NEW.created_at, NEW.updated_at)
+        ON CONFLICT DO NOTHING;
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE transactions_partitioned
+        SET user_id = NEW.user_id, type = NEW.type, amount = NEW.amount, category = NEW.category,
+            description = NEW.description, date = NEW.date, created_at = NEW.created_at, updated_at = NEW.updated_at
+        WHERE id = OLD.id AND date = OLD.date;
+    ELSE
+        DELETE FROM transactions_partitioned WHERE id = OLD.id AND date = OLD.date;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_transactions_mirror ON transactions;
+CREATE TRIGGER trg_transactions_mirror
+    AFTER INSERT OR UPDATE OR DELETE ON transactions
+    FOR EACH ROW EXECUTE FUNCTION mirror_transactions_to_partitioned();
+
+CREATE TABLE IF NOT EXISTS transactions_backfill_state (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    last_id INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO transactions_backfill_state (id, last_id) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+-- Copies the next batch of legacy rows in id order. Source rows are locked FOR SHARE so a
+-- concurrent mirrored UPDATE cannot be overwritten by a stale copy. Returns rows copied.
+CREATE OR REPLACE FUNCTION backfill_transactions_partitioned(batch_size INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    start_id INTEGER;
+    end_id INTEGER;
+    copied INTEGER;
+BEGIN
+    SELECT last_id INTO start_id FROM transactions_backfill_state WHERE id = 1 FOR UPDATE;
+
+    WITH batch AS (
+        SELECT * FROM transactions
+        WHERE id > start_id
+        ORDER BY id
+        LIMIT batch_size
+        FOR SHARE
+    ), inserted AS (
+        INSERT INTO transactions_partitioned (id, user_id, type, amount, category, description, date, created_at, updated_at)
+        SELECT id, user_id, type, amount, category, description, date, created_at, updated_at FROM batch
+        ON CONFLICT DO NOTHING
+    )
+    SELECT MAX(id), COUNT(*) INTO end_id, copied FROM batch;
+
+    IF end_id IS NOT NULL THEN
+        UPDATE transactions_backfill_state SET last_id = end_id WHERE id = 1;
+    END IF;
+
+    RETURN copied;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,52 @@
+-- Step 2 of the online move of transactions to monthly range partitions.
+-- Runs a final catch-up under a short exclusive lock, then swaps the tables by rename.
+-- The legacy heap is kept as transactions_legacy until it is verified and dropped manually.
+
+LOCK TABLE transactions IN ACCESS EXCLUSIVE MODE;
+
+INSERT INTO transactions_partitioned (id, user_id, type, amount, category, description, date, created_at, updated_at)
+SELECT id, user_id, type, amount, category, description, date, created_at, updated_at
+FROM transactions
+WHERE id > (SELECT last_id FROM transactions_backfill_state WHERE id = 1)
+ON CONFLICT DO NOTHING;
+
+DROP TRIGGER IF EXISTS trg_transactions_mirror ON transactions;
+DROP TRIGGER IF EXISTS trg_transactions_stats_delta ON transactions;
+DROP FUNCTION IF EXISTS mirror_transactions_to_partitioned();
+DROP FUNCTION IF EXISTS backfill_transactions_partitioned(INTEGER);
+DROP TABLE IF EXISTS transactions_backfill_state;
+
+-- platform_metrics is bound to the legacy table; rebuild it after the swap
+DROP MATERIALIZED VIEW IF EXISTS platform_metrics;
+
+ALTER TABLE transactions RENAME TO transactions_legacy;
+ALTER TABLE transactions_legacy RENAME CONSTRAINT transactions_pkey TO transactions_legacy_pkey;
+ALTER INDEX IF EXISTS idx_transactions_user_id RENAME TO idx_transactions_legacy_user_id;
+ALTER INDEX IF EXISTS idx_transactions_date RENAME TO idx_transactions_legacy_date;
+
+ALTER TABLE transactions_partitioned RENAME TO transactions;
+ALTER TABLE transactions RENAME CONSTRAINT transactions_partitioned_pkey TO transactions_pkey;
+ALTER INDEX idx_transactions_p_user_id RENAME TO idx_transactions_user_id;
+ALTER INDEX idx_transactions_p_date RENAME TO idx_transactions_date;
+
+ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id;
+
+CREATE TRIGGER trg_transactions_stats_delta
+    AFTER INSERT OR UPDATE OF date, type, amount OR DELETE ON transactions
+    FOR EACH ROW EXECUTE FUNCTION log_transaction_stats_delta();
+
+CREATE MATERIALIZED VIEW platform_metrics AS
+SELECT
+    1 AS id,
+    (SELECT COUNT(*) FROM users WHERE email IS NOT NULL) AS total_users,
+    (SELECT COUNT(*) FROM users
+        WHERE email IS NOT NULL AND is_premium = TRUE
+          AND (premium_expires_at IS NULL OR premium_expires_at >= CURRENT_TIMESTAMP)) AS premium_users,
+    (SELECT COUNT(DISTINCT user_id) FROM transactions
+        WHERE date >= CURRENT_DATE - 30) AS active_users_30d,
+    (SELECT COUNT(*) FROM goals WHERE target_amount > 0) AS total_goals,
+    (SELECT COUNT(*) FROM goals
+        WHERE target_amount > 0 AND current_amount >= target_amount) AS completed_goals,
+    CURRENT_TIMESTAMP AS refreshed_at;
+
+CREATE UNIQUE INDEX idx_platform_metrics_id ON platform_metrics(id);
@@ -0,0 +1,29 @@
+-- Indexes shaped after the handler queries so each list read is an ordered (index-only) scan
+-- with no sort step. Checked by scripts/index_advisor.py.
+
+-- transactions GET: user_id = ? AND amount > 0 ORDER BY date DESC, created_at DESC.
+-- description (unbounded TEXT) is left out of INCLUDE to keep index tuples under the size
+-- limit; it is fetched from the heap for the rows returned.
+CREATE INDEX IF NOT EXISTS idx_transactions_user_listing
+    ON transactions(user_id, date DESC, created_at DESC)
+    INCLUDE (id, type, amount, category)
+    WHERE amount > 0;
+
+-- goals GET: user_id = ? AND target_amount > 0 ORDER BY deadline
+CREATE INDEX IF NOT EXISTS idx_goals_user_listing
+    ON goals(user_id, deadline)
+    INCLUDE (id, name, target_amount, current_amount, created_at)
+    WHERE target_amount > 0;
+
+-- organizations GET: user_id = ? ORDER BY created_at DESC; supersedes the plain user_id index
+CREATE INDEX IF NOT EXISTS idx_organizations_user_listing
+    ON organizations(user_id, created_at DESC)
+    INCLUDE (id, name, type, tax_system, updated_at);
+
+DROP INDEX IF EXISTS idx_organizations_user_id;
+
+-- admin-users GET: email IS NOT NULL ORDER BY created_at DESC
+CREATE INDEX IF NOT EXISTS idx_users_listing
+    ON users(created_at DESC)
+    INCLUDE (id, email, first_name, last_name, username, is_premium, premium_expires_at)
+    WHERE email IS NOT NULL;
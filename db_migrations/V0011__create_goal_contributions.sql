@@ -0,0 +1,23 @@
+-- Ledger of goal contributions; goals.current_amount is maintained as its running total
+CREATE TABLE IF NOT EXISTS goal_contributions (
+    id SERIAL PRIMARY KEY,
+    goal_id INTEGER NOT NULL REFERENCES goals(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    amount DECIMAL(15, 2) NOT NULL,
+    transaction_id INTEGER,
+    transaction_date DATE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (transaction_id, transaction_date) REFERENCES transactions(id, date) ON DELETE SET NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_goal_contributions_goal_id ON goal_contributions(goal_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_goal_contributions_transaction
+    ON goal_contributions(transaction_id, transaction_date)
+    WHERE transaction_id IS NOT NULL;
+
+-- Opening balances so existing aggregates reconcile against the ledger
+INSERT INTO goal_contributions (goal_id, user_id, amount, created_at)
+SELECT id, user_id, current_amount, created_at
+FROM goals
+WHERE current_amount <> 0
+  AND NOT EXISTS (SELECT 1 FROM goal_contributions c WHERE c.goal_id = goals.id);
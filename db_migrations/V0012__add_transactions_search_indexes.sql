@@ -0,0 +1,13 @@
+-- Search over transaction category and description.
+-- Both indexes lead with user_id (btree_gin) so a search only visits the caller's entries.
+-- The indexed expressions must match SEARCH_TEXT in backend/transactions/index.py exactly.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+-- Full-text search with ranking and highlighting
+CREATE INDEX IF NOT EXISTS idx_transactions_search_fts
+    ON transactions USING GIN (user_id, to_tsvector('russian', category || ' ' || COALESCE(description, '')));
+
+-- Fuzzy fallback (typos, partial words) through trigram word similarity
+CREATE INDEX IF NOT EXISTS idx_transactions_search_trgm
+    ON transactions USING GIN (user_id, (category || ' ' || COALESCE(description, '')) gin_trgm_ops);
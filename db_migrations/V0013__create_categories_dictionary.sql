@@ -0,0 +1,92 @@
+-- Category dictionary: global (user_id IS NULL) and per-user entries keyed by a normalized name.
+-- transactions.category_id lets aggregations group on integers; transactions.category keeps
+-- the canonical display name.
+CREATE TABLE IF NOT EXISTS categories (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    name VARCHAR(255) NOT NULL,
+    normalized_name VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_global_name ON categories(normalized_name) WHERE user_id IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_user_name ON categories(user_id, normalized_name) WHERE user_id IS NOT NULL;
+
+-- Auto-categorization rules: pattern is a case-insensitive regular expression searched in the
+-- transaction description; higher priority wins, user rules before global ones
+CREATE TABLE IF NOT EXISTS category_rules (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    pattern VARCHAR(255) NOT NULL,
+    category_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+    priority INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_category_rules_user_id ON category_rules(user_id);
+
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS category_id INTEGER REFERENCES categories(id);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_category ON transactions(user_id, category_id);
+
+INSERT INTO categories (name, normalized_name) VALUES
+    ('Продукты', 'продукты'),
+    ('Кафе и рестораны', 'кафе и рестораны'),
+    ('Транспорт', 'транспорт'),
+    ('Жильё', 'жилье'),
+    ('Коммунальные услуги', 'коммунальные услуги'),
+    ('Связь и интернет', 'связь и интернет'),
+    ('Здоровье', 'здоровье'),
+    ('Одежда', 'одежда'),
+    ('Развлечения', 'развлечения'),
+    ('Образование', 'образование'),
+    ('Подписки', 'подписки'),
+    ('Налоги', 'налоги'),
+    ('Цели', 'цели'),
+    ('Зарплата', 'зарплата'),
+    ('Подработка', 'подработка'),
+    ('Инвестиции', 'инвестиции'),
+    ('Подарки', 'подарки'),
+    ('Другое', 'другое')
+ON CONFLICT DO NOTHING;
+
+INSERT INTO category_rules (pattern, category_id, priority)
+SELECT r.pattern, c.id, r.priority
+FROM (VALUES
+    ('пят[её]рочк|магнит|перекр[её]ст|ашан|лента|вкусвилл|дикси|продукт|супермаркет', 'продукты', 10),
+    ('кафе|ресторан|кофе|пицц|суши|макдональдс|вкусно и точка|бургер|доставка еды', 'кафе и рестораны', 10),
+    ('такси|метро|автобус|электричк|бензин|азс|парковк|каршеринг|тройка', 'транспорт', 10),
+    ('аренд|ипотек|квартплат', 'жилье', 10),
+    ('жкх|электроэнерг|газоснабж|водоснабж|коммунал', 'коммунальные услуги', 10),
+    ('мтс|билайн|мегафон|теле2|интернет|связь', 'связь и интернет', 5),
+    ('аптек|врач|клиник|стоматолог|анализ', 'здоровье', 10),
+    ('кино|театр|концерт|игр|steam', 'развлечения', 5),
+    ('курс|обучени|школ|университет|книг', 'образование', 5),
+    ('подписк|netflix|spotify|яндекс плюс|кинопоиск|youtube', 'подписки', 20),
+    ('налог|фнс|усн|ндфл', 'налоги', 10),
+    ('зарплат|аванс|оклад', 'зарплата', 10),
+    ('дивиденд|купон|брокер|вклад|процент', 'инвестиции', 5),
+    ('подар', 'подарки', 5)
+) AS r(pattern, normalized_name, priority)
+JOIN categories c ON c.user_id IS NULL AND c.normalized_name = r.normalized_name
+WHERE NOT EXISTS (SELECT 1 FROM category_rules);
+
+-- Existing free-text categories: reuse a global entry when the normalized name matches,
+-- otherwise create a per-user entry, then link every transaction
+INSERT INTO categories (user_id, name, normalized_name)
+SELECT DISTINCT ON (t.user_id, n.normalized_name) t.user_id, trim(t.category), n.normalized_name
+FROM transactions t
+CROSS JOIN LATERAL (
+    SELECT lower(regexp_replace(trim(translate(t.category, 'Ёё', 'Ее')), '\s+', ' ', 'g')) AS normalized_name
+) n
+WHERE NOT EXISTS (
+    SELECT 1 FROM categories g WHERE g.user_id IS NULL AND g.normalized_name = n.normalized_name
+)
+ON CONFLICT DO NOTHING;
+
+UPDATE transactions t
+SET category_id = c.id
+FROM categories c
+WHERE t.category_id IS NULL
+  AND c.normalized_name = lower(regexp_replace(trim(translate(t.category, 'Ёё', 'Ее')), '\s+', ' ', 'g'))
+  AND (c.user_id IS NULL OR c.user_id = t.user_id);
@@ -0,0 +1,47 @@
+-- Per-user data version for transactions, bumped once per statement by the users it touched.
+-- Analytics snapshots are keyed by this version and rebuilt when it moves.
+CREATE TABLE IF NOT EXISTS user_data_versions (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION bump_user_data_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO user_data_versions (user_id)
+        SELECT DISTINCT user_id FROM old_rows
+        ON CONFLICT (user_id) DO UPDATE
+        SET version = user_data_versions.version + 1, updated_at = CURRENT_TIMESTAMP;
+    ELSE
+        INSERT INTO user_data_versions (user_id)
+        SELECT DISTINCT user_id FROM new_rows
+        ON CONFLICT (user_id) DO UPDATE
+        SET version = user_data_versions.version + 1, updated_at = CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition-table triggers allow a single event each
+DROP TRIGGER IF EXISTS trg_transactions_version_insert ON transactions;
+CREATE TRIGGER trg_transactions_version_insert
+    AFTER INSERT ON transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+DROP TRIGGER IF EXISTS trg_transactions_version_update ON transactions;
+CREATE TRIGGER trg_transactions_version_update
+    AFTER UPDATE ON transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+DROP TRIGGER IF EXISTS trg_transactions_version_delete ON transactions;
+CREATE TRIGGER trg_transactions_version_delete
+    AFTER DELETE ON transactions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+INSERT INTO user_data_versions (user_id)
+SELECT DISTINCT user_id FROM transactions
+ON CONFLICT (user_id) DO NOTHING;
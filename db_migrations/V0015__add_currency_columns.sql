@@ -0,0 +1,13 @@
+-- ISO 4217 currency per transaction and goal, and a base currency for each user's summaries.
+-- Constant defaults, so existing rows are not rewritten.
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS currency CHAR(3) NOT NULL DEFAULT 'RUB';
+ALTER TABLE goals ADD COLUMN IF NOT EXISTS currency CHAR(3) NOT NULL DEFAULT 'RUB';
+ALTER TABLE users ADD COLUMN IF NOT EXISTS base_currency CHAR(3) NOT NULL DEFAULT 'RUB';
+
+-- goals GET now returns currency; rebuild the covering index so the list stays index-only
+CREATE INDEX IF NOT EXISTS idx_goals_user_listing_currency
+    ON goals(user_id, deadline)
+    INCLUDE (id, name, target_amount, current_amount, currency, created_at)
+    WHERE target_amount > 0;
+
+DROP INDEX IF EXISTS idx_goals_user_listing;
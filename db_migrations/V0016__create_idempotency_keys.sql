@@ -0,0 +1,18 @@
+-- Responses of mutating requests sent with an Idempotency-Key header, replayed on retries.
+-- The row is claimed in the same transaction as the write it guards, so it exists exactly when
+-- the write committed; a concurrent retry with the same key waits on the primary key until then.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    function_name VARCHAR(50) NOT NULL,
+    scope VARCHAR(50) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status_code INTEGER,
+    response_headers JSONB,
+    response_body TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (function_name, scope, key)
+);
+
+-- Cleanup by the maintenance job (task expire_idempotency_keys)
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
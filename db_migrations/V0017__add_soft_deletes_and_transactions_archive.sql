@@ -0,0 +1,144 @@
+-- Soft deletes for transactions and goals, and an archive tier for old transactions.
+-- Handlers mark rows deleted_at instead of deleting them; the tombstones serve undo and
+-- ?deletedSince= sync reads, and the maintenance job purges them after a retention period.
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+ALTER TABLE goals ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+
+-- Tombstone reads (sync and purge); small, since only deleted rows are indexed
+CREATE INDEX IF NOT EXISTS idx_transactions_tombstones
+    ON transactions(user_id, deleted_at)
+    WHERE deleted_at IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_goals_tombstones
+    ON goals(user_id, deleted_at)
+    WHERE deleted_at IS NOT NULL;
+
+-- Listing indexes cover live rows only; the handler queries carry the same predicate
+CREATE INDEX IF NOT EXISTS idx_transactions_user_live
+    ON transactions(user_id, date DESC, created_at DESC)
+    INCLUDE (id, type, amount, category)
+    WHERE amount > 0 AND deleted_at IS NULL;
+
+DROP INDEX IF EXISTS idx_transactions_user_listing;
+
+CREATE INDEX IF NOT EXISTS idx_goals_user_live
+    ON goals(user_id, deadline)
+    INCLUDE (id, name, target_amount, current_amount, currency, created_at)
+    WHERE target_amount > 0 AND deleted_at IS NULL;
+
+DROP INDEX IF EXISTS idx_goals_user_listing_currency;
+
+-- Stats count live rows: a soft delete subtracts, a restore adds back, purging a tombstone
+-- changes nothing. Rows moved by the archive job keep their history untouched.
+CREATE OR REPLACE FUNCTION log_transaction_stats_delta() RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('app.archiving', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.deleted_at IS NULL THEN
+        INSERT INTO transaction_stats_deltas (day, type, tx_count, amount)
+        VALUES (OLD.date, OLD.type, -1, -OLD.amount);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.deleted_at IS NULL THEN
+        INSERT INTO transaction_stats_deltas (day, type, tx_count, amount)
+        VALUES (NEW.date, NEW.type, 1, NEW.amount);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_transactions_stats_delta ON transactions;
+CREATE TRIGGER trg_transactions_stats_delta
+    AFTER INSERT OR UPDATE OF date, type, amount, deleted_at OR DELETE ON transactions
+    FOR EACH ROW EXECUTE FUNCTION log_transaction_stats_delta();
+
+DROP MATERIALIZED VIEW IF EXISTS platform_metrics;
+
+CREATE MATERIALIZED VIEW platform_metrics AS
+SELECT
+    1 AS id,
+    (SELECT COUNT(*) FROM users WHERE email IS NOT NULL) AS total_users,
+    (SELECT COUNT(*) FROM users
+        WHERE email IS NOT NULL AND is_premium = TRUE
+          AND (premium_expires_at IS NULL OR premium_expires_at >= CURRENT_TIMESTAMP)) AS premium_users,
+    (SELECT COUNT(DISTINCT user_id) FROM transactions
+        WHERE date >= CURRENT_DATE - 30 AND deleted_at IS NULL) AS active_users_30d,
+    (SELECT COUNT(*) FROM goals WHERE target_amount > 0 AND deleted_at IS NULL) AS total_goals,
+    (SELECT COUNT(*) FROM goals
+        WHERE target_amount > 0 AND deleted_at IS NULL AND current_amount >= target_amount) AS completed_goals,
+    CURRENT_TIMESTAMP AS refreshed_at;
+
+CREATE UNIQUE INDEX idx_platform_metrics_id ON platform_metrics(id);
+
+-- One row per user and archived month; rows holds that month's transactions as a JSONB array.
+-- A low toast_tuple_target makes even small months go through TOAST compression.
+CREATE TABLE IF NOT EXISTS transactions_archive (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    month DATE NOT NULL,
+    tx_count INTEGER NOT NULL,
+    rows JSONB NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, month)
+) WITH (toast_tuple_target = 128);
+
+-- Totals of archived months, so balances and summaries stay complete without the archive
+CREATE TABLE IF NOT EXISTS transaction_archive_rollups (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    month DATE NOT NULL,
+    type VARCHAR(10) NOT NULL,
+    currency CHAR(3) NOT NULL,
+    category_id INTEGER NOT NULL DEFAULT 0,
+    tx_count INTEGER NOT NULL,
+    total_amount DECIMAL(18, 2) NOT NULL,
+    PRIMARY KEY (user_id, month, type, currency, category_id)
+);
+
+-- Moves one month of transactions into the archive and drops its partition. Live rows are
+-- archived and rolled up, tombstones are discarded. Rows that reach the month later (they land
+-- in transactions_default) are merged into the same archive rows by the next run.
+-- Goal contributions lose their transaction link through the ON DELETE SET NULL key.
+CREATE OR REPLACE FUNCTION archive_transactions_month(month_start DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    next_month DATE := (month_start + INTERVAL '1 month')::date;
+    partition_name TEXT := 'transactions_p' || to_char(month_start, 'YYYY_MM');
+    archived INTEGER;
+BEGIN
+    PERFORM set_config('app.archiving', 'on', true);
+
+    WITH moved AS (
+        DELETE FROM transactions
+        WHERE date >= month_start AND date < next_month
+        RETURNING *
+    ), live AS (
+        SELECT * FROM moved WHERE deleted_at IS NULL
+    ), rollups AS (
+        INSERT INTO transaction_archive_rollups (user_id, month, type, currency, category_id, tx_count, total_amount)
+        SELECT user_id, month_start, type, currency, COALESCE(category_id, 0), COUNT(*), SUM(amount)
+        FROM live
+        GROUP BY user_id, type, currency, COALESCE(category_id, 0)
+        ON CONFLICT (user_id, month, type, currency, category_id) DO UPDATE
+        SET tx_count = transaction_archive_rollups.tx_count + EXCLUDED.tx_count,
+            total_amount = transaction_archive_rollups.total_amount + EXCLUDED.total_amount
+    ), archive AS (
+        INSERT INTO transactions_archive (user_id, month, tx_count, rows)
+        SELECT user_id, month_start, COUNT(*), jsonb_agg(to_jsonb(live) - 'user_id' - 'deleted_at' ORDER BY date, id)
+        FROM live
+        GROUP BY user_id
+        ON CONFLICT (user_id, month) DO UPDATE
+        SET tx_count = transactions_archive.tx_count + EXCLUDED.tx_count,
+            rows = transactions_archive.rows || EXCLUDED.rows,
+            archived_at = CURRENT_TIMESTAMP
+    )
+    SELECT COUNT(*) INTO archived FROM live;
+
+    PERFORM set_config('app.archiving', 'off', true);
+
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        EXECUTE format('ALTER TABLE transactions DETACH PARTITION %I', partition_name);
+        EXECUTE format('DROP TABLE %I', partition_name);
+    END IF;
+
+    RETURN archived;
+END;
+$$ LANGUAGE plpgsql;
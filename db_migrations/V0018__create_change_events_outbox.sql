@@ -0,0 +1,41 @@
+-- Transactional outbox: mutating handlers append one row per change in the same transaction as
+-- the write, so an event exists exactly when its change committed. A statement trigger wakes
+-- LISTEN change_events consumers at commit; consumers then read the outbox, never the base tables.
+CREATE TABLE IF NOT EXISTS change_events (
+    id BIGSERIAL PRIMARY KEY,
+    txid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    source VARCHAR(32) NOT NULL,
+    entity VARCHAR(32) NOT NULL,
+    action VARCHAR(32) NOT NULL,
+    user_id INTEGER,
+    entity_ids BIGINT[] NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Ids are allocated before commit, so a lower id can become visible after a higher one.
+-- Consumers read in (txid, id) order, only below the oldest running transaction, which makes
+-- every position they checkpoint final.
+CREATE INDEX IF NOT EXISTS idx_change_events_txid ON change_events(txid, id);
+
+CREATE INDEX IF NOT EXISTS idx_change_events_created_at ON change_events(created_at);
+
+CREATE TABLE IF NOT EXISTS change_event_checkpoints (
+    consumer VARCHAR(64) PRIMARY KEY,
+    last_txid XID8 NOT NULL DEFAULT '0',
+    last_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Notifications are delivered at commit and identical ones in a transaction are folded,
+-- so a bulk import still wakes each listener once
+CREATE OR REPLACE FUNCTION notify_change_events() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('change_events', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_change_events_notify ON change_events;
+CREATE TRIGGER trg_change_events_notify
+    AFTER INSERT ON change_events
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_change_events();
@@ -0,0 +1,28 @@
+-- Spending anomalies found by the detect_spending_anomalies maintenance task: one row per user,
+-- month, kind ('spike' or 'new_recurring'), category and currency. The category name is copied
+-- in so the API reads a user's insights from the index alone.
+CREATE TABLE IF NOT EXISTS spending_insights (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    month DATE NOT NULL,
+    kind VARCHAR(16) NOT NULL,
+    category_id INTEGER NOT NULL DEFAULT 0,
+    currency CHAR(3) NOT NULL,
+    category VARCHAR(255),
+    amount DECIMAL(15, 2) NOT NULL,
+    baseline DECIMAL(15, 2) NOT NULL,
+    score REAL NOT NULL,
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, month, kind, category_id, currency)
+);
+
+-- Serves GET /analytics?view=insights as an index-only scan in display order
+CREATE INDEX IF NOT EXISTS idx_spending_insights_user_listing
+    ON spending_insights(user_id, month DESC, score DESC)
+    INCLUDE (kind, category_id, currency, category, amount, baseline);
+
+-- Progress of incremental batch jobs: the last month a job has fully processed
+CREATE TABLE IF NOT EXISTS batch_job_state (
+    job VARCHAR(64) PRIMARY KEY,
+    last_month DATE NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
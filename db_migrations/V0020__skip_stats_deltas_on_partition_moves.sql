@@ -0,0 +1,42 @@
+-- ensure_transactions_partitions moves rows parked in transactions_default into a new monthly
+-- partition by DELETE + INSERT. The DELETE fired the stats-delta trigger cloned onto the
+-- default partition and the INSERT (into the not yet attached table) did not, so every move
+-- logged unmatched -1 deltas. The move now runs with app.archiving on, which the trigger
+-- skips since V0017: the rows stay counted once, as they were before the move.
+CREATE OR REPLACE FUNCTION ensure_transactions_partitions(from_date DATE, months_ahead INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    parent TEXT;
+    month_start DATE := date_trunc('month', from_date)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    next_month DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    SELECT CASE WHEN relkind = 'p' THEN 'transactions' ELSE 'transactions_partitioned' END
+    INTO parent
+    FROM pg_class WHERE oid = 'transactions'::regclass;
+
+    WHILE month_start <= last_month LOOP
+        next_month := (month_start + INTERVAL '1 month')::date;
+        partition_name := 'transactions_p' || to_char(month_start, 'YYYY_MM');
+
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                           partition_name, parent);
+            PERFORM set_config('app.archiving', 'on', true);
+            EXECUTE format('WITH moved AS (DELETE FROM transactions_default WHERE date >= %L AND date < %L RETURNING *) '
+                           'INSERT INTO %I SELECT * FROM moved',
+                           month_start, next_month, partition_name);
+            PERFORM set_config('app.archiving', 'off', true);
+            EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           parent, partition_name, month_start, next_month);
+            created := created + 1;
+        END IF;
+
+        month_start := next_month;
+    END LOOP;
+
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
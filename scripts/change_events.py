@@ -0,0 +1,156 @@
+'''
+Change-event consumer: drains the change_events outbox (see V0018) in batches, remembers its
+position in change_event_checkpoints and sleeps on LISTEN change_events between batches, so
+caches and downstream jobs react within milliseconds of a commit without polling the base tables.
+
+Delivery is at-least-once: the checkpoint moves only after the handler returns, so a consumer
+that dies mid-batch gets that batch again. Handlers should be idempotent (invalidation is).
+Events are read in (txid, id) order and only from transactions older than every running one;
+a long-running transaction therefore delays delivery until it ends, but never loses an event.
+
+Library use:
+    consumer = ChangeEventConsumer(os.environ['DATABASE_URL'], 'dashboard-cache')
+    consumer.run(lambda events: invalidate({event['user_id'] for event in events}))
+
+Usage: DATABASE_URL=postgresql://... python scripts/change_events.py --consumer tail [--once]
+Prints the consumed events as JSON lines.
+'''
+
+import argparse
+import json
+import os
+import select
+import sys
+from typing import Dict, Any, List, Callable, Optional, Tuple
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+CHANNEL = 'change_events'
+RETRY_BACKOFF = 0.05
+
+Handler = Callable[[List[Dict[str, Any]]], None]
+
+
+class ChangeEventConsumer:
+    '''One named consumer; several processes must not share a name'''
+
+    def __init__(self, dsn: str, name: str, batch_size: int = 500, idle_timeout: float = 30.0):
+        self.name = name
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.conn = psycopg2.connect(dsn)
+        # Notifications are only delivered between transactions, so stay in autocommit
+        self.conn.autocommit = True
+        self.position = self.load_checkpoint()
+
+    def load_checkpoint(self) -> Tuple[str, int]:
+        with self.conn.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO change_event_checkpoints (consumer)
+                VALUES (%s)
+                ON CONFLICT (consumer) DO NOTHING
+            ''', (self.name,))
+            cursor.execute('''
+                SELECT last_txid::text, last_id
+                FROM change_event_checkpoints
+                WHERE consumer = %s
+            ''', (self.name,))
+            last_txid, last_id = cursor.fetchone()
+        return last_txid, last_id
+
+    def fetch_batch(self) -> List[Dict[str, Any]]:
+        # Range scan on idx_change_events_txid from the checkpoint; rows of transactions that
+        # may still be followed by an earlier-numbered commit are left for the next call
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute('''
+                SELECT id, txid::text AS txid, source, entity, action, user_id, entity_ids, created_at
+                FROM change_events
+                WHERE (txid, id) > (%s::xid8, %s)
+                  AND txid < pg_snapshot_xmin(pg_current_snapshot())
+                ORDER BY txid, id
+                LIMIT %s
+            ''', (*self.position, self.batch_size))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def checkpoint(self, events: List[Dict[str, Any]]) -> None:
+        last = events[-1]
+        with self.conn.cursor() as cursor:
+            cursor.execute('''
+                UPDATE change_event_checkpoints
+                SET last_txid = %s::xid8, last_id = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE consumer = %s
+            ''', (last['txid'], last['id'], self.name))
+        self.position = (last['txid'], last['id'])
+
+    def drain(self, handle: Handler) -> int:
+        '''Hands every visible event to handle in batches; returns how many were consumed'''
+        consumed = 0
+        while True:
+            events = self.fetch_batch()
+            if events:
+                handle(events)
+                self.checkpoint(events)
+                consumed += len(events)
+            if len(events) < self.batch_size:
+                return consumed
+
+    def wait(self, timeout: float) -> bool:
+        '''Blocks until a notification arrives or timeout passes; True if notified'''
+        if not self.conn.notifies:
+            ready, _, _ = select.select([self.conn], [], [], timeout)
+            if ready:
+                self.conn.poll()
+        notified = bool(self.conn.notifies)
+        self.conn.notifies.clear()
+        return notified
+
+    def run(self, handle: Handler, once: bool = False) -> None:
+        # LISTEN before the first drain, so a commit landing in between still wakes us
+        with self.conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+
+        notified = False
+        backoff: Optional[float] = None
+        while True:
+            consumed = self.drain(handle)
+            if once:
+                return
+            # A wake-up that found nothing means the event sits behind an older running
+            # transaction: poll again with backoff rather than wait for the next notification
+            if consumed or not (notified or backoff):
+                backoff = None
+            else:
+                backoff = RETRY_BACKOFF if backoff is None else backoff * 2
+                backoff = backoff if backoff < self.idle_timeout else None
+            notified = self.wait(backoff or self.idle_timeout)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def print_events(events: List[Dict[str, Any]]) -> None:
+    for event in events:
+        print(json.dumps(event, default=str, ensure_ascii=False))
+    sys.stdout.flush()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Consume change_events with a checkpoint and print them')
+    parser.add_argument('--consumer', default='tail', help='checkpoint name')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--idle-timeout', type=float, default=30.0, help='seconds between polls without notifications')
+    parser.add_argument('--once', action='store_true', help='drain what is visible and exit')
+    args = parser.parse_args()
+
+    consumer = ChangeEventConsumer(os.environ['DATABASE_URL'], args.consumer, args.batch_size, args.idle_timeout)
+    try:
+        consumer.run(print_events, once=args.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        consumer.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
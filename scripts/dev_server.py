@@ -0,0 +1,286 @@
+'''
+Local dev server: serves every backend/*/index.py handler in one process so the whole API can
+be load-tested and profiled offline against a local Postgres.
+
+Each function is mounted at /<name>, where name is the backend directory (the keys of
+backend/func2url.json). Requests are turned into the same event dicts the cloud runtime
+passes (httpMethod, headers, queryStringParameters, body) and run on a thread pool.
+Handlers are reloaded when their source changes.
+
+Usage: DATABASE_URL=postgresql://localhost/planner python scripts/dev_server.py [--port 8000] [--workers 16] [--profile out/]
+'''
+
+import argparse
+import base64
+import cProfile
+import importlib.util
+import json
+import os
+import pstats
+import signal
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Any, Optional, Callable, List
+from urllib.parse import urlsplit, parse_qsl
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+
+class Context:
+    def __init__(self, function_name: str):
+        self.request_id = str(uuid.uuid4())
+        self.function_name = function_name
+        self.memory_limit_in_mb = 128
+        self._deadline = time.time() + 30
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self._deadline - time.time()) * 1000))
+
+
+class FunctionRegistry:
+    '''Loads handlers by directory name and reloads them when any .py file in the directory changes.
+
+    Functions ship their own copies of helper modules (validation.py in several of them), so
+    each function's siblings are imported fresh and then dropped from sys.modules again: the
+    handler keeps its own copy and the next function cannot pick it up by name.
+    Directory and mtime scans are cached for SCAN_INTERVAL seconds.'''
+
+    SCAN_INTERVAL = 1.0
+
+    def __init__(self, backend_dir: str):
+        self.backend_dir = backend_dir
+        self.lock = threading.Lock()
+        self.loaded: Dict[str, Dict[str, Any]] = {}
+        self.cached_names: List[str] = []
+        self.names_scanned_at = 0.0
+
+    def names(self) -> List[str]:
+        now = time.monotonic()
+        if now - self.names_scanned_at >= self.SCAN_INTERVAL:
+            self.cached_names = sorted(
+                name for name in os.listdir(self.backend_dir)
+                if os.path.isfile(os.path.join(self.backend_dir, name, 'index.py'))
+            )
+            self.names_scanned_at = now
+        return self.cached_names
+
+    def sources(self, name: str) -> Dict[str, float]:
+        function_dir = os.path.join(self.backend_dir, name)
+        return {
+            filename[:-3]: os.path.getmtime(os.path.join(function_dir, filename))
+            for filename in os.listdir(function_dir) if filename.endswith('.py')
+        }
+
+    def get(self, name: str) -> Optional[Callable]:
+        if name not in self.names():
+            return None
+
+        entry = self.loaded.get(name)
+        now = time.monotonic()
+        if entry and now - entry['checked_at'] < self.SCAN_INTERVAL:
+            return entry['handler']
+
+        with self.lock:
+            entry = self.loaded.get(name)
+            sources = self.sources(name)
+            mtime = max(sources.values())
+            if entry and entry['mtime'] == mtime:
+                entry['checked_at'] = now
+                return entry['handler']
+
+            function_dir = os.path.join(self.backend_dir, name)
+            siblings = [module for module in sources if module != 'index']
+            for module in siblings:
+                sys.modules.pop(module, None)
+
+            spec = importlib.util.spec_from_file_location(f'backend_{name.replace("-", "_")}', os.path.join(function_dir, 'index.py'))
+            module = importlib.util.module_from_spec(spec)
+            sys.path.insert(0, function_dir)
+            try:
+                spec.loader.exec_module(module)
+            finally:
+                sys.path.remove(function_dir)
+                for sibling in siblings:
+                    sys.modules.pop(sibling, None)
+
+            if entry:
+                print(f'Reloaded {name}')
+            self.loaded[name] = {'mtime': mtime, 'checked_at': now, 'handler': module.handler}
+            return module.handler
+
+
+class Profiler:
+    '''Collects per-function cProfile stats across worker threads'''
+
+    def __init__(self, output_dir: Optional[str]):
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.stats: Dict[str, pstats.Stats] = {}
+
+    def run(self, name: str, func: Callable, *args):
+        if not self.output_dir:
+            return func(*args)
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args)
+        finally:
+            with self.lock:
+                if name in self.stats:
+                    self.stats[name].add(profile)
+                else:
+                    self.stats[name] = pstats.Stats(profile)
+
+    def dump(self):
+        if not self.output_dir:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        for name, stats in self.stats.items():
+            path = os.path.join(self.output_dir, f'{name}.prof')
+            stats.dump_stats(path)
+            print(f'Profile for {name} written to {path}')
+
+
+def build_event(method: str, path: str, headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+    url = urlsplit(path)
+    return {
+        'httpMethod': method,
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(url.query)),
+        'body': body.decode('utf-8') if body else '',
+        'isBase64Encoded': False,
+        'url': url.path,
+        'requestContext': {'requestId': str(uuid.uuid4()), 'httpMethod': method},
+    }
+
+
+class FunctionRequestHandler(BaseHTTPRequestHandler):
+    registry: FunctionRegistry
+    profiler: Profiler
+
+    def handle_any(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/', 1)
+        name = parts[0]
+
+        try:
+            handler = self.registry.get(name) if name else None
+        except Exception as e:
+            self.send_json(502, {'error': f'Failed to load {name}: {type(e).__name__}: {e}'})
+            return
+        if not handler:
+            self.send_json(404, {'error': f'Unknown function: {name}', 'functions': self.registry.names()})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        tail = '/' + parts[1] if len(parts) > 1 else '/'
+        event = build_event(self.command, tail + (f'?{url.query}' if url.query else ''), dict(self.headers.items()), body)
+
+        started = time.perf_counter()
+        try:
+            response = self.profiler.run(name, handler, event, Context(name))
+        except Exception as e:
+            self.send_json(502, {'error': f'{type(e).__name__}: {e}'})
+            print(f'{self.command} /{name} raised {type(e).__name__}: {e}')
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        payload = response.get('body') or ''
+        if response.get('isBase64Encoded'):
+            payload = base64.b64decode(payload)
+        elif not isinstance(payload, bytes):
+            payload = payload.encode('utf-8')
+
+        self.send_response(response.get('statusCode', 200))
+        for key, value in (response.get('headers') or {}).items():
+            self.send_header(key, str(value))
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('X-Handler-Time-Ms', f'{elapsed_ms:.2f}')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_json(self, status: int, data: Dict[str, Any]):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_OPTIONS = do_PATCH = handle_any
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class ThreadPoolHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    '''HTTPServer that dispatches requests to a bounded worker pool instead of a thread per request'''
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, handler_class, workers: int, quiet: bool):
+        super().__init__(address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='handler')
+        self.quiet = quiet
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Serve all backend functions locally')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--profile', metavar='DIR', help='write per-function cProfile stats to DIR on exit')
+    parser.add_argument('--quiet', action='store_true', help='disable per-request access log')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        print('DATABASE_URL is not set', file=sys.stderr)
+        return 2
+
+    registry = FunctionRegistry(BACKEND_DIR)
+    profiler = Profiler(args.profile)
+    FunctionRequestHandler.registry = registry
+    FunctionRequestHandler.profiler = profiler
+
+    with open(os.path.join(BACKEND_DIR, 'func2url.json')) as f:
+        deployed = json.load(f)
+
+    server = ThreadPoolHTTPServer((args.host, args.port), FunctionRequestHandler, args.workers, args.quiet)
+    for name in registry.names():
+        marker = '' if name in deployed else '  (not in func2url.json)'
+        print(f'  http://{args.host}:{args.port}/{name}{marker}')
+    print(f'Serving {len(registry.names())} functions with {args.workers} workers')
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        profiler.dump()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+'''
+Index advisor: runs EXPLAIN (ANALYZE, BUFFERS) for every handler query against seeded data
+and flags plans that regressed (sort steps, sequential scans, heap fetches on index-only
+scans, buffer usage above the recorded baseline).
+
+Usage: DATABASE_URL=postgresql://... python scripts/index_advisor.py [--seed] [--update-baseline]
+Exit code is 1 when any regression is found.
+'''
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Any, List
+import psycopg2
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'index_advisor_baseline.json')
+SEED_EMAIL = 'seed_1@index-advisor.local'
+BUFFER_TOLERANCE = 1.5
+
+# Kept in sync with the SQL in backend/*/index.py; %(user_id)s is the seeded user
+QUERIES: Dict[str, Dict[str, Any]] = {
+    'transactions.list': {
+        'sql': '''
+            SELECT id, type, amount, currency, category, category_id, description, date, created_at
+            FROM transactions
+            WHERE user_id = %(user_id)s AND amount > 0 AND deleted_at IS NULL
+            ORDER BY date DESC, created_at DESC
+        ''',
+        'index_only': False,
+    },
+    'transactions.list_range': {
+        'sql': '''
+            SELECT id, type, amount, currency, category, category_id, description, date, created_at
+            FROM transactions
+            WHERE user_id = %(user_id)s AND amount > 0 AND deleted_at IS NULL
+              AND date >= CURRENT_DATE - 90 AND date <= CURRENT_DATE
+            ORDER BY date DESC, created_at DESC
+        ''',
+        'index_only': False,
+    },
+    'goals.list': {
+        'sql': '''
+            SELECT id, name, target_amount, current_amount, currency, deadline, created_at
+            FROM goals
+            WHERE user_id = %(user_id)s AND target_amount > 0 AND deleted_at IS NULL
+            ORDER BY deadline ASC
+        ''',
+        'index_only': True,
+    },
+    'organizations.list': {
+        'sql': '''
+            SELECT id, name, type, tax_system, created_at, updated_at
+            FROM organizations
+            WHERE user_id = %(user_id)s
+            ORDER BY created_at DESC
+        ''',
+        'index_only': True,
+    },
+    'admin-users.list': {
+        'sql': '''
+            SELECT id, email, first_name, last_name, username, created_at, is_premium, premium_expires_at
+            FROM users
+            WHERE email IS NOT NULL
+            ORDER BY created_at DESC
+        ''',
+        'index_only': True,
+    },
+    'analytics.insights': {
+        'sql': '''
+            SELECT month, kind, category_id, category, currency, amount, baseline, score
+            FROM spending_insights
+            WHERE user_id = %(user_id)s
+            ORDER BY month DESC, score DESC
+            LIMIT 50
+        ''',
+        'index_only': True,
+    },
+    'premium.check': {
+        'sql': 'SELECT is_premium, premium_expires_at FROM users WHERE id = %(user_id)s',
+        'index_only': False,
+    },
+}
+
+def seed(conn, users: int, transactions_per_user: int) -> None:
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO users (email, first_name, created_at)
+        SELECT 'seed_' || n || '@index-advisor.local', 'Seed', CURRENT_TIMESTAMP - (n || ' minutes')::interval
+        FROM generate_series(1, %s) AS n
+        ON CONFLICT (email) DO NOTHING
+    ''', (users,))
+    cursor.execute('SELECT ensure_transactions_partitions(CURRENT_DATE - 730, 3)')
+    cursor.execute('''
+        INSERT INTO transactions (user_id, type, amount, category, description, date)
+        SELECT u.id,
+               CASE WHEN n %% 4 = 0 THEN 'income' ELSE 'expense' END,
+               (n %% 5000) + 1,
+               'Категория ' || (n %% 12),
+               'Seed transaction ' || n,
+               CURRENT_DATE - (n %% 730)
+        FROM users u, generate_series(1, %s) AS n
+        WHERE u.email LIKE '%%@index-advisor.local'
+    ''', (transactions_per_user,))
+    cursor.execute('''
+        INSERT INTO goals (user_id, name, target_amount, current_amount, deadline)
+        SELECT u.id, 'Seed goal ' || n, 10000 * n, 100 * n, CURRENT_DATE + n
+        FROM users u, generate_series(1, 20) AS n
+        WHERE u.email LIKE '%%@index-advisor.local'
+    ''')
+    cursor.execute('''
+        INSERT INTO organizations (user_id, name, type, tax_system)
+        SELECT u.id, 'Seed org ' || n, 'ООО', 'УСН'
+        FROM users u, generate_series(1, 5) AS n
+        WHERE u.email LIKE '%%@index-advisor.local'
+    ''')
+    cursor.execute('''
+        INSERT INTO spending_insights (user_id, month, kind, category_id, currency, category, amount, baseline, score)
+        SELECT u.id, (date_trunc('month', CURRENT_DATE) - make_interval(months => n))::date, 'spike', n %% 12,
+               'RUB', 'Категория ' || (n %% 12), 5000, 1000, 4.5
+        FROM users u, generate_series(1, 24) AS n
+        WHERE u.email LIKE '%%@index-advisor.local'
+        ON CONFLICT DO NOTHING
+    ''')
+    conn.commit()
+    cursor.close()
+
+    # Index-only scans depend on the visibility map, so vacuum before measuring
+    conn.autocommit = True
+    cursor = conn.cursor()
+    for table in ('users', 'transactions', 'goals', 'organizations', 'spending_insights'):
+        cursor.execute(f'VACUUM ANALYZE {table}')
+    cursor.close()
+    conn.autocommit = False
+
+def walk_plan(node: Dict[str, Any]) -> List[Dict[str, Any]]:
+    nodes = [node]
+    for child in node.get('Plans', []):
+        nodes.extend(walk_plan(child))
+    return nodes
+
+def explain(cursor, sql: str, user_id: int) -> Dict[str, Any]:
+    cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, {'user_id': user_id})
+    plan = cursor.fetchone()[0][0]
+    nodes = walk_plan(plan['Plan'])
+    return {
+        'node_types': sorted({node['Node Type'] for node in nodes}),
+        'heap_fetches': sum(node.get('Heap Fetches', 0) for node in nodes),
+        'shared_buffers': plan['Plan'].get('Shared Hit Blocks', 0) + plan['Plan'].get('Shared Read Blocks', 0),
+        'execution_ms': plan.get('Execution Time'),
+    }
+
+def find_regressions(name: str, spec: Dict[str, Any], result: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    problems = []
+    node_types = result['node_types']
+
+    if 'Sort' in node_types or 'Incremental Sort' in node_types:
+        problems.append('plan has a sort step')
+    if 'Seq Scan' in node_types:
+        problems.append('plan has a sequential scan')
+    if spec['index_only'] and 'Index Only Scan' not in node_types:
+        problems.append('expected an index-only scan')
+    if spec['index_only'] and result['heap_fetches'] > 0:
+        problems.append(f"index-only scan fetched {result['heap_fetches']} heap tuples (vacuum needed?)")
+
+    previous = baseline.get(name)
+    if previous and result['shared_buffers'] > previous['shared_buffers'] * BUFFER_TOLERANCE:
+        problems.append(f"buffers {result['shared_buffers']} vs baseline {previous['shared_buffers']}")
+
+    return problems
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='EXPLAIN every handler query and flag plan regressions')
+    parser.add_argument('--seed', action='store_true', help='insert seed users and rows before measuring')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--transactions-per-user', type=int, default=2000)
+    parser.add_argument('--update-baseline', action='store_true', help='record current buffer usage as baseline')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+
+    if args.seed:
+        seed(conn, args.users, args.transactions_per_user)
+
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM users WHERE email = %s', (SEED_EMAIL,))
+    row = cursor.fetchone()
+    if not row:
+        print('Seed user not found, run with --seed first', file=sys.stderr)
+        return 2
+    user_id = row[0]
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = False
+    for name, spec in QUERIES.items():
+        result = explain(cursor, spec['sql'], user_id)
+        conn.rollback()
+        results[name] = result
+        problems = find_regressions(name, spec, result, baseline)
+        failed = failed or bool(problems)
+
+        status = 'REGRESSION' if problems else 'ok'
+        print(f"{name:28} {status:10} {result['execution_ms']:>9.2f} ms  "
+              f"buffers={result['shared_buffers']:<6} nodes={', '.join(result['node_types'])}")
+        for problem in problems:
+            print(f"    - {problem}")
+
+    cursor.close()
+    conn.close()
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({name: {'shared_buffers': r['shared_buffers']} for name, r in results.items()}, f, indent=2)
+        print(f'Baseline written to {BASELINE_PATH}')
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
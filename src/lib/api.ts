@@ -6,6 +6,36 @@ const API_URLS = {
   goals: 'https://functions.poehali.dev/091e051e-e26b-44b6-9573-1f56eb20f154',
 };
 
+// Echoed back on reads so the backend keeps serving them from the primary right after a write
+let lastWriteAt: string | null = null;
+
+const rememberWrite = (response: Response) => {
+  const marker = response.headers.get('X-Last-Write-At');
+  if (marker) lastWriteAt = marker;
+};
+
+const withWriteMarker = (headers: Record<string, string>): Record<string, string> =>
+  lastWriteAt ? { ...headers, 'X-Last-Write-At': lastWriteAt } : headers;
+
+// Mutations carry one Idempotency-Key across retries, so a retried write is replayed by the
+// backend instead of being applied twice
+const WRITE_RETRIES = 2;
+
+const fetchWrite = async (url: string, init: RequestInit): Promise<Response> => {
+  const headers = { ...(init.headers as Record<string, string>), 'Idempotency-Key': crypto.randomUUID() };
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await fetch(url, { ...init, headers });
+      if (response.status < 500 || attempt >= WRITE_RETRIES) {
+        if (response.ok) rememberWrite(response);
+        return response;
+      }
+    } catch (error) {
+      if (attempt >= WRITE_RETRIES) throw error;
+    }
+  }
+};
+
 export const getUserIdFromCookie = (): string | null => {
   const cookies = document.cookie.split(';');
   const userIdCookie = cookies.find(c => c.trim().startsWith('userId='));
@@ -55,13 +85,13 @@ export const loginAdmin = async (email: string, password: string) => {
 export const getAdminUsers = async (adminId: string) => {
   const response = await fetch(API_URLS.adminUsers, {
     method: 'GET',
-    headers: { 'X-Admin-Id': adminId },
+    headers: withWriteMarker({ 'X-Admin-Id': adminId }),
   });
   return response.json();
 };
 
 export const createAdminUser = async (adminId: string, firstName: string, lastName: string) => {
-  const response = await fetch(API_URLS.adminUsers, {
+  const response = await fetchWrite(API_URLS.adminUsers, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
@@ -73,7 +103,7 @@ export const createAdminUser = async (adminId: string, firstName: string, lastNa
 };
 
 export const deleteAdminUser = async (adminId: string, userId: string) => {
-  const response = await fetch(`${API_URLS.adminUsers}?id=${userId}`, {
+  const response = await fetchWrite(`${API_URLS.adminUsers}?id=${userId}`, {
     method: 'DELETE',
     headers: { 'X-Admin-Id': adminId },
   });
@@ -81,7 +111,7 @@ export const deleteAdminUser = async (adminId: string, userId: string) => {
 };
 
 export const grantPremium = async (adminId: string, userId: string, days: number = 30) => {
-  const response = await fetch(API_URLS.adminUsers, {
+  const response = await fetchWrite(API_URLS.adminUsers, {
     method: 'PUT',
     headers: {
       'Content-Type': 'application/json',
@@ -93,7 +123,7 @@ export const grantPremium = async (adminId: string, userId: string, days: number
 };
 
 export const revokePremium = async (adminId: string, userId: string) => {
-  const response = await fetch(API_URLS.adminUsers, {
+  const response = await fetchWrite(API_URLS.adminUsers, {
     method: 'PUT',
     headers: {
       'Content-Type': 'application/json',
@@ -107,14 +137,22 @@ export const revokePremium = async (adminId: string, userId: string) => {
 export const getTransactions = async (userId: string) => {
   const response = await fetch(API_URLS.transactions, {
     method: 'GET',
-    headers: { 'X-User-Id': userId },
+    headers: withWriteMarker({ 'X-User-Id': userId }),
+  });
+  return response.json();
+};
+
+export const searchTransactions = async (userId: string, query: string, limit: number = 50) => {
+  const response = await fetch(`${API_URLS.transactions}?q=${encodeURIComponent(query)}&limit=${limit}`, {
+    method: 'GET',
+    headers: withWriteMarker({ 'X-User-Id': userId }),
   });
   return response.json();
 };
 
 export const createTransaction = async (userId: string, transaction: any) => {
   try {
-    const response = await fetch(API_URLS.transactions, {
+    const response = await fetchWrite(API_URLS.transactions, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -144,25 +182,38 @@ export const createTransaction = async (userId: string, transaction: any) => {
   }
 };
 
-export const deleteTransaction = async (userId: string, transactionId: string) => {
-  const response = await fetch(`${API_URLS.transactions}?id=${transactionId}`, {
+export const deleteTransaction = async (userId: string, transactionId: string, date?: string) => {
+  const dateParam = date ? `&date=${date}` : '';
+  const response = await fetchWrite(`${API_URLS.transactions}?id=${transactionId}${dateParam}`, {
     method: 'DELETE',
     headers: { 'X-User-Id': userId },
   });
   return response.json();
 };
 
+export const restoreTransaction = async (userId: string, transactionId: string, date?: string) => {
+  const response = await fetchWrite(API_URLS.transactions, {
+    method: 'PUT',
+    headers: {
+      'Content-Type': 'application/json',
+      'X-User-Id': userId,
+    },
+    body: JSON.stringify({ id: transactionId, date, restore: true }),
+  });
+  return response.json();
+};
+
 export const getGoals = async (userId: string) => {
   const response = await fetch(API_URLS.goals, {
     method: 'GET',
-    headers: { 'X-User-Id': userId },
+    headers: withWriteMarker({ 'X-User-Id': userId }),
   });
   return response.json();
 };
 
 export const createGoal = async (userId: string, goal: any) => {
   try {
-    const response = await fetch(API_URLS.goals, {
+    const response = await fetchWrite(API_URLS.goals, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -193,7 +244,7 @@ export const createGoal = async (userId: string, goal: any) => {
 };
 
 export const updateGoalProgress = async (userId: string, goalId: string, amount: number) => {
-  const response = await fetch(API_URLS.goals, {
+  const response = await fetchWrite(API_URLS.goals, {
     method: 'PUT',
     headers: {
       'Content-Type': 'application/json',
@@ -205,9 +256,21 @@ export const updateGoalProgress = async (userId: string, goalId: string, amount:
 };
 
 export const deleteGoal = async (userId: string, goalId: string) => {
-  const response = await fetch(`${API_URLS.goals}?id=${goalId}`, {
+  const response = await fetchWrite(`${API_URLS.goals}?id=${goalId}`, {
     method: 'DELETE',
     headers: { 'X-User-Id': userId },
   });
   return response.json();
+};
+
+export const restoreGoal = async (userId: string, goalId: string) => {
+  const response = await fetchWrite(API_URLS.goals, {
+    method: 'PUT',
+    headers: {
+      'Content-Type': 'application/json',
+      'X-User-Id': userId,
+    },
+    body: JSON.stringify({ id: goalId, restore: true }),
+  });
+  return response.json();
 };
\ No newline at end of file
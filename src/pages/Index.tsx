@@ -239,7 +239,8 @@ const Index = () => {
     if (!userId) return;
 
     try {
-      const result = await apiDeleteTransaction(userId, id);
+      const transaction = transactions.find(t => t.id === id);
+      const result = await apiDeleteTransaction(userId, id, transaction?.date);
       if (result.success) {
         setTransactions(transactions.filter(t => t.id !== id));
         toast({